@@ -1,20 +1,82 @@
 from __future__ import absolute_import, unicode_literals
 
 from copy import deepcopy
+from datetime import timedelta
 
 from django.conf.urls import url
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.functional import cached_property
+from django.utils.timezone import now
 
 from mezzanine.core.admin import TabularDynamicInlineAdmin, DisplayableAdmin, OwnableAdmin
 from mezzanine.utils.admin import admin_url
 
 from .models import Event, Occurrence, EventCategory
 from .event_import import EventImportMixin
+from .forms import OccurrenceInlineFormSet
+from .routing import remember_write
+
+
+class EventDateFilter(admin.SimpleListFilter):
+    title = "dates"
+    parameter_name = "dates"
+
+    def lookups(self, request, model_admin):
+        return [("upcoming", "Upcoming"), ("past", "Past")]
+
+    def queryset(self, request, queryset):
+        if self.value() == "upcoming":
+            return queryset.upcoming()
+        if self.value() == "past":
+            return queryset.past()
+        return queryset
+
+
+class NextStartFilter(admin.SimpleListFilter):
+    title = "next start"
+    parameter_name = "next_start"
+    days = {"today": 1, "week": 7, "month": 31}
+
+    def lookups(self, request, model_admin):
+        return [("today", "Next 24 hours"), ("week", "Next 7 days"), ("month", "Next 31 days")]
+
+    def queryset(self, request, queryset):
+        if self.value() in self.days:
+            end = now() + timedelta(days=self.days[self.value()])
+            return queryset.upcoming().filter(next_start__lte=end)
+        return queryset
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counting every row of a big table is slow on PostgreSQL. Use the
+    planner's estimate instead when it's over ``exact_limit`` rows.
+    """
+
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        connection = connections[qs.db]
+        if connection.vendor == "postgresql":
+            sql, params = qs.order_by().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                estimate = cursor.fetchone()[0][0]["Plan"]["Plan Rows"]
+            if estimate > self.exact_limit:
+                return estimate
+        return super(EstimatedCountPaginator, self).count
 
 
 class OccurrenceInlineAdmin(TabularDynamicInlineAdmin):
     model = Occurrence
+    formset = OccurrenceInlineFormSet
     extra = 0
     min_num = 1
 
@@ -23,7 +85,13 @@ class OccurrenceInlineAdmin(TabularDynamicInlineAdmin):
 class EventAdmin(DisplayableAdmin, OwnableAdmin, EventImportMixin):
     fieldsets = [
         (None, {"fields": ["title", "status", "featured", "featured_image", "link", "content"]}),
-        ("Location", {"classes": ["collapse-closed"], "fields": ["location", "address"]}),
+        (
+            "Location",
+            {
+                "classes": ["collapse-closed"],
+                "fields": ["location", "address", ("latitude", "longitude")],
+            },
+        ),
         (
             "Advanced Options",
             {
@@ -36,12 +104,48 @@ class EventAdmin(DisplayableAdmin, OwnableAdmin, EventImportMixin):
     filter_horizontal = ("categories", "related_events")
     inlines = (OccurrenceInlineAdmin,)
 
-    list_display = ["admin_thumb", "title", "featured", "user", "status"]
+    list_display = [
+        "admin_thumb",
+        "title",
+        "featured",
+        "next_start",
+        "occurrence_count",
+        "user",
+        "status",
+    ]
     list_editable = ["featured"]
+    list_filter = [EventDateFilter, NextStartFilter] + list(DisplayableAdmin.list_filter)
+    list_select_related = ["user"]
+    ordering = ["next_start", "-last_end"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     class Media:
         css = {"all": ("mezzanine_events/event_admin.css",)}
 
+    def get_queryset(self, request):
+        """
+        Count the occurrences of each event in the same query.
+        """
+        occurrences = Occurrence.objects.filter(event=OuterRef("pk")).order_by()
+        occurrences = occurrences.values("event").annotate(count=Count("pk")).values("count")
+        count = Coalesce(Subquery(occurrences, output_field=IntegerField()), 0)
+        return super(EventAdmin, self).get_queryset(request).annotate(occurrence_count=count)
+
+    def get_ordering(self, request):
+        """
+        Upcoming events first, then the past ones from the last to end.
+        Same as ``ordering``, which only takes field names in Django 1.11,
+        with the events without dates last on every database.
+        """
+        return [F("next_start").asc(nulls_last=True), F("last_end").desc(nulls_last=True)]
+
+    def occurrence_count(self, obj):
+        return obj.occurrence_count
+
+    occurrence_count.short_description = "Occurrences"
+    occurrence_count.admin_order_field = "occurrence_count"
+
     def save_form(self, request, form, change):
         """
         Super class ordering is important here - user must get saved first.
@@ -49,6 +153,18 @@ class EventAdmin(DisplayableAdmin, OwnableAdmin, EventImportMixin):
         OwnableAdmin.save_form(self, request, form, change)
         return DisplayableAdmin.save_form(self, request, form, change)
 
+    def save_model(self, request, obj, form, change):
+        """
+        Read the event and its occurrences from the default database for a
+        while, until the replica has them.
+        """
+        super(EventAdmin, self).save_model(request, obj, form, change)
+        remember_write(request)
+
+    def delete_model(self, request, obj):
+        super(EventAdmin, self).delete_model(request, obj)
+        remember_write(request)
+
     def get_urls(self):
         """
         Add custom admin views.
@@ -71,6 +187,7 @@ class EventAdmin(DisplayableAdmin, OwnableAdmin, EventImportMixin):
     def duplicate_event(self, request, event_id):
         event = get_object_or_404(Event, pk=event_id)
         duplicate = event.duplicate()
+        remember_write(request)
         msg = "Event duplication complete. You can edit the duplicate below."
         self.message_user(request, msg)
         return redirect(admin_url(Event, "change", duplicate.pk))
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class EventsConfig(AppConfig):
     name = "mezzanine_events"
     verbose_name = "Events"
+
+    def ready(self):
+        from . import signals  # noqa
@@ -0,0 +1,260 @@
+"""
+Maintenance of the per-month occurrence counts behind the archive views.
+
+Every change to an occurrence, or to the publishing status, site or
+categories of an event, applies the difference between the counts of the
+old and new versions to ``OccurrenceCount`` instead of counting again.
+Bulk operations bypass the signals, use ``rebuild_occurrence_counts``
+afterwards.
+
+Rows without a category hold the totals. Only PostgreSQL and SQLite keep
+them unique, see migration 0010, so they are summed when read: concurrent
+changes on other databases can add a second row for a month, which
+``rebuild_occurrence_counts`` merges.
+
+Only the events that ``published()`` shows are counted, as told by
+``Event.counted``. Publish and expiry dates pass without any change to
+the event, ``update_occurrence_counts`` recounts those events.
+
+Repetitions without an end are counted for ``EVENTS_COUNT_HORIZON`` days
+after the start of their occurrence. The counts of an occurrence only
+depend on its own fields, so they are the same when it's added and when
+it's subtracted later.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import threading
+
+from collections import Counter, defaultdict, namedtuple
+from datetime import timedelta
+
+from django.db.models import F, Q, Sum
+from django.utils.timezone import localtime, now
+
+from mezzanine.conf import settings
+from mezzanine.core.models import CONTENT_STATUS_PUBLISHED
+from mezzanine.utils.sites import current_site_id
+
+from .expansion import get_expander
+from .models import ArchivedOccurrence, Event, Occurrence, OccurrenceCount
+
+# What decides where the repetitions of an event are counted
+EventState = namedtuple("EventState", "site_id published category_ids")
+
+_local = threading.local()
+
+
+def month_counts(occurrences):
+    """
+    Number of repetitions of some occurrences that start in each local
+    (year, month). Repetitions without an end are counted up to
+    ``EVENTS_COUNT_HORIZON`` days after the start.
+    """
+    expander = get_expander()
+    horizon = timedelta(days=settings.EVENTS_COUNT_HORIZON)
+    counts = Counter()
+    for occurrence in occurrences:
+        if not occurrence.start:
+            continue
+        if occurrence.repeat:
+            # Repetitions keep the local time, no need to make them aware
+            to_date = occurrence.start + horizon
+            starts = expander.repeat_starts(occurrence, to_date=to_date, limit=None)
+        else:
+            starts = [localtime(occurrence.start)]
+        counts.update((start.year, start.month) for start in starts)
+    return counts
+
+
+def cell_counts(occurrences, state):
+    """
+    Counts of some occurrences of an event keyed by the fields of
+    ``OccurrenceCount``, with the category set to None for the total.
+    """
+    counts = Counter()
+    if state is None or not state.published:
+        return counts
+    for (year, month), count in month_counts(occurrences).items():
+        for category_id in (None,) + state.category_ids:
+            counts[(state.site_id, year, month, category_id)] += count
+    return counts
+
+
+def published_filter(when):
+    """
+    Filter of the events that ``published()`` shows at a given time.
+    """
+    return Q(
+        Q(publish_date__lte=when) | Q(publish_date__isnull=True),
+        Q(expiry_date__gte=when) | Q(expiry_date__isnull=True),
+        status=CONTENT_STATUS_PUBLISHED,
+    )
+
+
+def event_states(event_id):
+    """
+    The ``EventState`` that the occurrences of an event are counted with, and
+    the one they should be counted with now. None twice if it doesn't exist.
+    """
+    fields = ("site_id", "status", "publish_date", "expiry_date", "counted")
+    event = Event._base_manager.filter(pk=event_id).values(*fields).first()
+    if event is None:
+        return None, None
+    categories = Event.categories.through.objects.filter(event_id=event_id)
+    category_ids = tuple(sorted(categories.values_list("eventcategory_id", flat=True)))
+    when = now()
+    started = event["publish_date"] is None or event["publish_date"] <= when
+    expired = event["expiry_date"] is not None and event["expiry_date"] < when
+    published = event["status"] == CONTENT_STATUS_PUBLISHED and started and not expired
+    counted = EventState(event["site_id"], event["counted"], category_ids)
+    return counted, counted._replace(published=published)
+
+
+def event_state(event_id):
+    """
+    The ``EventState`` that the occurrences of an event are counted with,
+    None if it doesn't exist.
+    """
+    return event_states(event_id)[0]
+
+
+def event_occurrences(event_id):
+    """
+    The live and archived occurrences of an event, which are counted alike.
+    """
+    archived = ArchivedOccurrence.objects.filter(event_id=event_id)
+    return list(Occurrence.objects.filter(event_id=event_id)) + list(archived)
+
+
+def apply_counts(counts, sign=1):
+    """
+    Add (or subtract) counts to the stored ones. Cells that change by the
+    same amount are updated together, so a change costs a few queries
+    even when it spans years.
+    """
+    counts = dict((cell, sign * count) for cell, count in counts.items() if count)
+    if not counts:
+        return
+    stored = OccurrenceCount.objects.filter(
+        site_id__in=set(cell[0] for cell in counts), year__in=set(cell[1] for cell in counts)
+    )
+    pks = dict(
+        (row[1:], row[0])
+        for row in stored.values_list("pk", "site_id", "year", "month", "category_id")
+    )
+    by_change = defaultdict(list)
+    new = []
+    for (site_id, year, month, category_id), count in counts.items():
+        pk = pks.get((site_id, year, month, category_id))
+        if pk is None:
+            new.append(
+                OccurrenceCount(
+                    site_id=site_id, year=year, month=month, category_id=category_id, count=count
+                )
+            )
+        else:
+            by_change[count].append(pk)
+    for count, change_pks in by_change.items():
+        # Stay below the query parameter limit of SQLite
+        while change_pks:
+            chunk, change_pks = change_pks[:500], change_pks[500:]
+            OccurrenceCount.objects.filter(pk__in=chunk).update(count=F("count") + count)
+            if count < 0:
+                # Only the decreased cells can drop to zero
+                OccurrenceCount.objects.filter(pk__in=chunk, count=0).delete()
+    OccurrenceCount.objects.bulk_create(new)
+
+
+def count_occurrence(occurrence, sign=1):
+    """
+    Add (or subtract) the repetitions of an occurrence as stored in the database.
+    """
+    if occurrence.event_id not in getattr(_local, "deleting", ()):
+        apply_counts(cell_counts([occurrence], event_state(occurrence.event_id)), sign)
+
+
+def recount_event(event_id, before):
+    """
+    Move the counts of all the occurrences of an event from a previous
+    ``EventState`` to the current one.
+    """
+    counted, after = event_states(event_id)
+    if counted != after:
+        # Saving the event writes back the value it was loaded with
+        Event._base_manager.filter(pk=event_id).update(counted=after.published)
+    if after == before:
+        return
+    occurrences = event_occurrences(event_id)
+    counts = cell_counts(occurrences, after)
+    counts.subtract(cell_counts(occurrences, before))
+    apply_counts(counts)
+
+
+def start_event_deletion(event):
+    """
+    Subtract all the occurrences of an event that is about to be deleted,
+    and ignore them while they are deleted along with it.
+    """
+    apply_counts(cell_counts(event_occurrences(event.pk), event_state(event.pk)), -1)
+    if not hasattr(_local, "deleting"):
+        _local.deleting = set()
+    _local.deleting.add(event.pk)
+
+
+def end_event_deletion(event):
+    getattr(_local, "deleting", set()).discard(event.pk)
+
+
+def recount_published():
+    """
+    Recount the events whose publish or expiry date passed since they were
+    counted. Returns their number.
+    """
+    published = published_filter(now())
+    events = Event._base_manager.filter(
+        (Q(counted=True) & ~published) | (Q(counted=False) & published)
+    )
+    event_ids = list(events.values_list("pk", flat=True))
+    for event_id in event_ids:
+        recount_event(event_id, event_state(event_id))
+    return len(event_ids)
+
+
+def rebuild_counts():
+    """
+    Count all occurrences again.
+    """
+    counts = Counter()
+    published = published_filter(now())
+    events = Event._base_manager.prefetch_related("occurrences", "archived_occurrences")
+    published_ids = set(Event._base_manager.filter(published).values_list("pk", flat=True))
+    for event in events:
+        occurrences = list(event.occurrences.all()) + list(event.archived_occurrences.all())
+        state = event_state(event.pk)._replace(published=event.pk in published_ids)
+        counts.update(cell_counts(occurrences, state))
+    Event._base_manager.exclude(published).update(counted=False)
+    Event._base_manager.filter(published).update(counted=True)
+    OccurrenceCount.objects.all().delete()
+    OccurrenceCount.objects.bulk_create(
+        OccurrenceCount(site_id=site_id, year=year, month=month, category_id=category_id, count=n)
+        for (site_id, year, month, category_id), n in counts.items()
+        if n
+    )
+    return len(counts)
+
+
+def archive_months(category_slug=None, year=None):
+    """
+    (year, month, count) of the months with occurrences in the current site,
+    in the given category or in all of them. Uses a single indexed query.
+    """
+    counts = OccurrenceCount.objects.filter(site_id=current_site_id())
+    if year is not None:
+        counts = counts.filter(year=year)
+    if category_slug:
+        counts = counts.filter(category__slug=category_slug)
+    else:
+        counts = counts.filter(category__isnull=True)
+    # Totals can be split in several rows where nothing keeps them unique
+    counts = counts.values("year", "month").annotate(total=Sum("count")).filter(total__gt=0)
+    return list(counts.order_by("year", "month").values_list("year", "month", "total"))
@@ -0,0 +1,391 @@
+"""
+Benchmarks for the calendar read paths, run with ``manage.py benchmark_events``.
+Each benchmark creates its own data, which is rolled back when it finishes,
+unless it sets ``commits`` because other threads need to see the data.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import random
+import threading
+
+from collections import OrderedDict
+from datetime import timedelta
+from timeit import default_timer
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sites.models import Site
+from django.db import close_old_connections
+from django.template.defaultfilters import date as datefmt
+from django.test import RequestFactory, override_settings
+from django.utils.timezone import localtime, now
+
+from eventtools.models import BaseOccurrence, OccurrenceQuerySet
+
+from mezzanine.utils.sites import current_site_id, override_current_site_id
+
+from . import concurrency, views
+from .conflicts import expand, find_conflicts, sweep
+from .expansion import get_expander
+from .formatting import get_formatter
+from .models import Event, EventCategory, Occurrence, OccurrenceMonth
+from .recommendations import update_recommendations
+from .records import load_records
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(func):
+    """
+    Register a benchmark function. It receives the output stream and the size option.
+    """
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def best_time(func, rounds=5):
+    """
+    Best wall time of several calls to ``func``, in milliseconds.
+    """
+    timings = []
+    for _ in range(rounds):
+        start = default_timer()
+        func()
+        timings.append(default_timer() - start)
+    return min(timings) * 1000
+
+
+# Minimal templates so the views can be rendered without a project
+TEMPLATES = [
+    {
+        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "OPTIONS": {
+            "loaders": [
+                (
+                    "django.template.loaders.locmem.Loader",
+                    {
+                        "mezzanine_events/event_grid.html": "{{ calendar }}",
+                        "mezzanine_events/event_list.html": "{{ featured_occurrences }}"
+                        "{% for o in occurrences %}{{ o.2.event.title }}{% endfor %}",
+                        "mezzanine_events/event_detail.html": "{{ event.title }}",
+                        "mezzanine_events/includes/upcoming_occurrences.html": "{{ occurrences }}",
+                    },
+                )
+            ]
+        },
+    }
+]
+
+
+def peak_memory(func):
+    """
+    Peak memory allocated while calling ``func``, in megabytes.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def get_user():
+    User = get_user_model()
+    user, _ = User.objects.get_or_create(username="benchmark-events")
+    return user
+
+
+def create_events(site, count, repeat="", location="", base=None, repeat_until=None, content=""):
+    """
+    Bulk create published events with one occurrence each, spread over the
+    year after ``base``. Returns the new occurrences.
+    """
+    user = get_user()
+    base = (base or now()).replace(minute=0, second=0, microsecond=0)
+    with override_current_site_id(site.pk):
+        prefix = "benchmark-%s-%s-" % (site.pk, Event.objects.count())
+        Event.objects.bulk_create(
+            Event(
+                site=site,
+                user=user,
+                title="Event %s" % i,
+                slug=prefix + str(i),
+                content=content,
+                location=location,
+            )
+            for i in range(count)
+        )
+        # bulk_create doesn't return primary keys on every backend
+        events = list(Event.objects.filter(slug__startswith=prefix))
+    occurrences = []
+    for i, event in enumerate(events):
+        start = base + timedelta(days=i * 365 // count, hours=i % 12)
+        occurrences.append(
+            Occurrence(
+                event=event,
+                site=site,
+                start=start,
+                end=start + timedelta(hours=2),
+                repeat=repeat,
+                repeat_until=repeat_until,
+            )
+        )
+    Occurrence.objects.bulk_create(occurrences)
+    occurrences = list(Occurrence.objects.filter(event__in=events))
+    OccurrenceMonth.objects.bulk_create(
+        month for occurrence in occurrences for month in OccurrenceMonth.for_occurrence(occurrence)
+    )
+    return occurrences
+
+
+def create_site(number):
+    return Site.objects.create(domain="benchmark-%s.example.com" % number, name="Benchmark")
+
+
+@benchmark
+def site_partition(stdout, size):
+    """
+    Time the month query of a single site while the rest of the install grows.
+    """
+    month_start = now() + timedelta(days=30)
+    month_end = month_start + timedelta(days=31)
+    sites = [create_site(0)]
+    create_events(sites[0], size)
+
+    stdout.write("sites  total occurrences  site candidates  month query (ms)")
+    for total_sites in (1, 10, 40):
+        while len(sites) < total_sites:
+            sites.append(create_site(len(sites)))
+            create_events(sites[-1], size)
+
+        with override_current_site_id(sites[0].pk):
+            qs = Occurrence.objects.published().select_related("event")
+            candidates = qs.for_period(month_start, month_end).count()
+            ms = best_time(lambda: list(qs.all_occurrences(month_start, month_end)))
+        total = Occurrence.objects.count()
+        stdout.write("%5d  %17d  %15d  %16.1f" % (total_sites, total, candidates, ms))
+
+
+@benchmark
+def expansion(stdout, size):
+    """
+    Compare the expansion of repeating occurrences by dateutil and by the expander.
+    """
+    base = now()
+    window = (base, base + timedelta(days=366))
+    expander = get_expander()
+    stdout.write("repeat              dateutil (ms)  expander (ms)")
+    for repeat, _ in Occurrence._meta.get_field("repeat").choices:
+        occurrences = [
+            Occurrence(
+                start=base - timedelta(days=i),
+                end=base - timedelta(days=i, hours=-1),
+                repeat=repeat,
+            )
+            for i in range(size)
+        ]
+        dateutil_ms = best_time(
+            lambda: [list(BaseOccurrence.all_occurrences(o, *window)) for o in occurrences], 1
+        )
+        expander_ms = best_time(lambda: expander.expand_all(occurrences, *window), 1)
+        stdout.write("%-18s  %13.1f  %13.1f" % (repeat, dateutil_ms, expander_ms))
+
+
+@benchmark
+def interval_index(stdout, size):
+    """
+    Time the query for next month's candidates while past and yearly events accumulate.
+    """
+    site = Site.objects.get(pk=current_site_id())
+    month_start = now() + timedelta(days=30)
+    month_end = month_start + timedelta(days=31)
+    past = now() - timedelta(days=3 * 365)
+    create_events(site, size, repeat="RRULE:FREQ=WEEKLY")
+
+    stdout.write("history  candidates (before/after)  query ms (before/after)")
+    for history in (0, size, size * 5, size * 20):
+        while Occurrence.objects.filter(start__lt=past + timedelta(days=366)).count() < history:
+            create_events(site, size // 2, base=past)
+            create_events(site, size // 2, repeat="RRULE:FREQ=YEARLY", base=past)
+
+        qs = Occurrence.objects.published()
+        before = OccurrenceQuerySet.for_period(qs, month_start, month_end)
+        after = qs.for_period(month_start, month_end)
+        stdout.write(
+            "%7d  %11d / %-11d  %10.1f / %.1f"
+            % (
+                history,
+                before.count(),
+                after.count(),
+                best_time(lambda: list(before.all())),
+                best_time(lambda: list(after.all())),
+            )
+        )
+
+
+@benchmark
+def conflicts(stdout, size):
+    """
+    Check a weekly booking against recurring bookings at the same location.
+    """
+    site = Site.objects.get(pk=current_site_id())
+    start = now().replace(minute=0, second=0, microsecond=0)
+    window = (start, start + timedelta(days=365))
+    create_events(site, size * 10, repeat="RRULE:FREQ=WEEKLY", location="Main Hall")
+
+    def brute_force():
+        existing = expand(Occurrence.objects.filter(event__location="Main Hall"), *window)
+        proposed = expand([Occurrence(start=start, repeat="RRULE:FREQ=WEEKLY")], *window)
+        return [(a, b) for a in existing for b in proposed if a[0] < b[1] and b[0] < a[1]]
+
+    def sweep_line():
+        existing = expand(Occurrence.objects.filter(event__location="Main Hall"), *window)
+        proposed = expand([Occurrence(start=start, repeat="RRULE:FREQ=WEEKLY")], *window)
+        return sweep(existing, proposed)
+
+    found = find_conflicts("Main Hall", start, repeat="RRULE:FREQ=WEEKLY")
+    stdout.write("%d bookings, %d conflicts found" % (size * 10, len(found)))
+    stdout.write("brute force (ms): %.1f" % best_time(brute_force, 1))
+    stdout.write("sweep line (ms):  %.1f" % best_time(sweep_line, 1))
+    stdout.write(
+        "find_conflicts (ms): %.1f"
+        % best_time(lambda: find_conflicts("Main Hall", start, repeat="RRULE:FREQ=WEEKLY"), 1)
+    )
+
+
+@benchmark
+def projection(stdout, size):
+    """
+    Expand a busy month of daily events with long descriptions, as model
+    instances and as listing records.
+    """
+    site = Site.objects.get(pk=current_site_id())
+    base = now() - timedelta(days=365)
+    window = (now(), now() + timedelta(days=31))
+    create_events(site, size, repeat="RRULE:FREQ=DAILY", base=base, content="Lorem ipsum " * 2000)
+    qs = Occurrence.objects.published()
+    models = lambda: list(qs.select_related("event").all_occurrences(*window))
+    records = lambda: list(
+        get_expander().expand_all(load_records(qs.for_period(*window)), *window)
+    )
+
+    stdout.write("%d events, %d occurrences in the month" % (size, len(records())))
+    stdout.write("                 time (ms)  peak memory (MB)")
+    for label, func in (("model instances", models), ("listing records", records)):
+        memory = "%16.1f" % peak_memory(func) if tracemalloc else "  needs Python 3"
+        stdout.write("%-15s  %9.1f  %s" % (label, best_time(func, 3), memory))
+
+
+@benchmark
+def formatting(stdout, size):
+    """
+    Label the occurrences of a list page of daily and weekly events, one at
+    a time with the ``date`` filter and in a batch with the formatter.
+    """
+    site = Site.objects.get(pk=current_site_id())
+    create_events(site, size // 2, repeat="RRULE:FREQ=DAILY")
+    create_events(site, size - size // 2, repeat="RRULE:FREQ=WEEKLY")
+    occurrence_tuples = list(Occurrence.objects.published().listing(now(), limit=100))
+
+    def date_filter():
+        for start, end, occurrence in occurrence_tuples:
+            local_start = localtime(start)
+            out = datefmt(local_start, "DATETIME_FORMAT")
+            if end not in (None, start):
+                local_end = localtime(end)
+                fmt = (
+                    "TIME_FORMAT" if local_end.date() == local_start.date() else "DATETIME_FORMAT"
+                )
+                out += " to {}".format(datefmt(local_end, fmt))
+
+    stdout.write("%d occurrences" % len(occurrence_tuples))
+    stdout.write("                 time (ms)")
+    stdout.write("date filter      %9.2f" % best_time(date_filter))
+    stdout.write(
+        "formatter        %9.2f" % best_time(lambda: get_formatter().label_all(occurrence_tuples))
+    )
+
+
+@benchmark
+def thread_pool(stdout, size):
+    """
+    Throughput of the list and JSON views under concurrent requests, with and
+    without the thread pool.
+    """
+    site = Site.objects.get(pk=current_site_id())
+    occurrences = create_events(site, size, repeat="RRULE:FREQ=WEEKLY")
+    event_ids = [occurrence.event_id for occurrence in occurrences]
+    Event.objects.filter(pk__in=event_ids[::2]).update(featured=True)
+    factory = RequestFactory()
+
+    def client(requests):
+        for i in range(requests):
+            if i % 2:
+                request = factory.get("/list/")
+                request.user = AnonymousUser()
+                views.event_list(request)
+            else:
+                views.event_json(factory.get("/json/"), event_ids[i % len(event_ids)])
+        close_old_connections()
+
+    stdout.write("pool size  clients  requests/s")
+    try:
+        with override_settings(TEMPLATES=TEMPLATES):
+            for pool_size in (0, 4):
+                concurrency._executor = None
+                with override_settings(EVENTS_THREAD_POOL_SIZE=pool_size):
+                    for clients in (1, 8):
+                        threads = [
+                            threading.Thread(target=client, args=(20,)) for _ in range(clients)
+                        ]
+                        start = default_timer()
+                        for thread in threads:
+                            thread.start()
+                        for thread in threads:
+                            thread.join()
+                        rate = clients * 20 / (default_timer() - start)
+                        stdout.write("%9d  %7d  %10.1f" % (pool_size, clients, rate))
+    finally:
+        concurrency._executor = None
+        Event.objects.filter(pk__in=event_ids).delete()
+
+
+thread_pool.commits = True
+
+
+@benchmark
+def recommendations(stdout, size):
+    """
+    Compute the recommendations of every event, then update them when
+    nothing changed and when 1% of the events changed.
+    """
+    site = Site.objects.get(pk=current_site_id())
+    occurrences = create_events(site, size, repeat="RRULE:FREQ=WEEKLY")
+    events = list(Event.objects.filter(pk__in=[o.event_id for o in occurrences]))
+    categories = [EventCategory.objects.create(title="Category %d" % i) for i in range(10)]
+    rnd = random.Random(0)
+    words = ["word%d" % i for i in range(2000)]
+    for event in events:
+        event.update_dates()
+        event.categories.add(rnd.choice(categories))
+        content = " ".join(rnd.choice(words) for _ in range(200))
+        Event.objects.filter(pk=event.pk).update(content=content)
+
+    def timed(label, **kwargs):
+        start = default_timer()
+        count = update_recommendations(**kwargs)
+        stdout.write("%-12s  %9.1f  %7d" % (label, (default_timer() - start) * 1000, count))
+
+    stdout.write("%d events" % size)
+    stdout.write("              time (ms)  updated")
+    timed("full", full=True)
+    timed("no changes")
+    for event in events[::100]:
+        content = " ".join(rnd.choice(words) for _ in range(200))
+        Event.objects.filter(pk=event.pk).update(content=content)
+    timed("1% changed")
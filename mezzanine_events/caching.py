@@ -0,0 +1,59 @@
+from __future__ import absolute_import, unicode_literals
+
+from time import time
+
+from django.core.cache import cache
+
+from mezzanine.conf import settings
+from mezzanine.utils.cache import cache_get, cache_installed, cache_set
+from mezzanine.utils.sites import current_site_id
+
+from .routing import read_database
+
+
+def generation_key(site_id):
+    return "mezzanine_events.%s.generation" % site_id
+
+
+def invalidate(site_id):
+    """
+    Discard all cached calendar data of a site by starting a new generation.
+    """
+    generation = int(time() * 1000)
+    cache.set(generation_key(site_id), generation, None)
+    return generation
+
+
+def current_generation():
+    """
+    The current site and its data generation, the time of its last invalidation in ms.
+    """
+    site_id = current_site_id()
+    return site_id, cache.get(generation_key(site_id)) or invalidate(site_id)
+
+
+def cache_key(*parts, **kwargs):
+    """
+    Build a cache key namespaced by the current site and its data generation.
+    """
+    site_id, generation = kwargs.get("generation") or current_generation()
+    return "mezzanine_events.%s.%s.%s" % (site_id, generation, ".".join(map(str, parts)))
+
+
+def cached(func, *parts):
+    """
+    Return the value of ``func()``, cached for the current site when the
+    cache is installed. ``parts`` must identify the value within the site.
+    """
+    if not cache_installed():
+        return func()
+    site_id, generation = current_generation()
+    key = cache_key(*parts, generation=(site_id, generation))
+    value = cache_get(key)
+    if value is None:
+        value = func()
+        # Right after a change the replica may still serve the old data
+        lag = settings.EVENTS_READ_DATABASE_LAG * 1000
+        if not read_database() or time() * 1000 - generation >= lag:
+            cache_set(key, value, settings.EVENTS_CACHE_SECONDS)
+    return value
@@ -0,0 +1,291 @@
+"""
+"Add to calendar" links for Google Calendar, Outlook and ICS downloads.
+
+The parts of a link that only depend on the event (title, location, the
+absolute URL of its page) are encoded once per event and request, and the
+URLs of the event pages are reversed once per slug, so linking a page of
+repetitions of the same event mostly formats dates.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.core.urlresolvers import get_script_prefix, get_urlconf, reverse
+from django.template.defaultfilters import urlencode
+from django.utils.timezone import (
+    get_current_timezone,
+    get_current_timezone_name,
+    localtime,
+    make_aware,
+    now,
+    utc,
+)
+
+from mezzanine.conf import settings
+
+from .formatting import OccurrenceTuple
+
+GOOGLE_URL = "https://www.google.com/calendar/event?"
+OUTLOOK_URL = "https://outlook.live.com/calendar/0/deeplink/compose?"
+
+# Discard reversed URLs past this size, the memo lives as long as the process
+MAX_CACHED = 10000
+
+# Timezones without a transition table are probed this often, up to this year
+PROBE_STEP = timedelta(days=7)
+LAST_PROBED_YEAR = 2037
+
+Links = namedtuple("Links", "google outlook ics")
+
+_paths = {}
+
+
+def event_path(name, slug):
+    """
+    Reverse an event URL by slug, memoized.
+    """
+    key = (get_urlconf(settings.ROOT_URLCONF), get_script_prefix(), name, slug)
+    path = _paths.get(key)
+    if path is None:
+        if len(_paths) > MAX_CACHED:
+            _paths.clear()
+        path = _paths[key] = reverse("mezzanine_events:" + name, args=[slug])
+    return path
+
+
+def utc_stamp(value):
+    return value.astimezone(utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def ics_escape(text):
+    for char, escaped in (("\\", "\\\\"), (";", "\\;"), (",", "\\,"), ("\n", "\\n")):
+        text = text.replace(char, escaped)
+    return text.replace("\r", "")
+
+
+def ics_fold(line, limit=75):
+    """
+    Split a content line in lines of at most ``limit`` octets in UTF-8,
+    counting the space that starts the continuation lines, without splitting characters.
+    """
+    if len(line.encode("utf-8")) <= limit:
+        return line
+    parts = []
+    part = []
+    size = 0
+    for char in line:
+        length = len(char.encode("utf-8"))
+        if size + length > limit:
+            parts.append("".join(part))
+            part = []
+            size = 1
+        part.append(char)
+        size += length
+    parts.append("".join(part))
+    return "\r\n ".join(parts)
+
+
+def ics_offset(delta):
+    minutes = int(delta.total_seconds()) // 60
+    sign = "-" if minutes < 0 else "+"
+    return "{}{:02d}{:02d}".format(sign, *divmod(abs(minutes), 60))
+
+
+def probe_transitions(tz, first_year, last_year):
+    """
+    UTC offset changes of a timezone between two years, found with the public
+    tzinfo methods. Changes less than ``PROBE_STEP`` apart can be missed.
+    """
+
+    def info(when):
+        local = when.replace(tzinfo=utc).astimezone(tz)
+        return local.utcoffset(), local.dst() or timedelta(0), local.tzname()
+
+    when = datetime(first_year, 1, 1)
+    transitions, infos = [datetime(1, 1, 1), when], [info(when)] * 2
+    minutes = int(PROBE_STEP.total_seconds()) // 60
+    while when.year <= last_year:
+        current = info(when + PROBE_STEP)
+        if current != infos[-1]:
+            # Look for the minute it changed
+            low, high = 0, minutes
+            while high - low > 1:
+                middle = (low + high) // 2
+                if info(when + timedelta(minutes=middle)) == infos[-1]:
+                    low = middle
+                else:
+                    high = middle
+            transitions.append(when + timedelta(minutes=high))
+            infos.append(current)
+        when += PROBE_STEP
+    return transitions, infos
+
+
+def ics_timezone(tz, tzid, first_year, last_year=None):
+    """
+    VTIMEZONE lines with the UTC offsets of a timezone between two years,
+    or up to its last known change without ``last_year``.
+    """
+    # Private to pytz timezones with DST, others are probed
+    transitions = getattr(tz, "_utc_transition_times", None)
+    infos = getattr(tz, "_transition_info", None)
+    if not isinstance(transitions, list) or not infos or len(infos) != len(transitions):
+        transitions, infos = probe_transitions(tz, first_year, last_year or LAST_PROBED_YEAR)
+
+    observances = []
+    for i in range(1, len(transitions)):
+        if last_year is not None and transitions[i].year > last_year:
+            break
+        previous = infos[i - 1][0]
+        offset, dst, name = infos[i]
+        observance = (transitions[i] + previous, previous, offset, dst, name)
+        if transitions[i].year < first_year:
+            # Only the one in effect when the period starts
+            observances = [observance]
+        else:
+            observances.append(observance)
+
+    lines = ["BEGIN:VTIMEZONE", "TZID:" + tzid]
+    for start, previous, offset, dst, name in observances:
+        kind = "DAYLIGHT" if dst else "STANDARD"
+        lines += [
+            "BEGIN:" + kind,
+            "DTSTART:" + start.strftime("%Y%m%dT%H%M%S"),
+            "TZOFFSETFROM:" + ics_offset(previous),
+            "TZOFFSETTO:" + ics_offset(offset),
+            "TZNAME:" + name,
+            "END:" + kind,
+        ]
+    lines.append("END:VTIMEZONE")
+    return lines
+
+
+class CalendarLinks(object):
+    """
+    Builds the links of the occurrences shown in a request.
+    """
+
+    def __init__(self, request=None):
+        self.request = request
+        self.events = {}
+
+    def absolute_uri(self, path):
+        if self.request is None:
+            return path
+        return self.request.build_absolute_uri(path)
+
+    def event_parts(self, event):
+        """
+        The encoded parts of the links that only depend on the event.
+        """
+        parts = self.events.get(event.pk)
+        if parts is None:
+            title = urlencode(event.title)
+            details = urlencode(self.absolute_uri(event_path("event_detail", event.slug)))
+            location = urlencode(event.location.replace("\n", " "))
+            parts = self.events[event.pk] = {
+                "google": "action=TEMPLATE&text={}&details={}&location={}".format(
+                    title, details, location
+                ),
+                "outlook": "path=%2Fcalendar%2Faction%2Fcompose&rru=addevent"
+                "&subject={}&body={}&location={}".format(title, details, location),
+                "ics": self.absolute_uri(event_path("event_ics", event.slug)),
+            }
+        return parts
+
+    def links(self, occurrence, start=None, end=None):
+        """
+        Links of an occurrence. Google gets the whole series of a repeating
+        occurrence, Outlook the repetition that starts at ``start``.
+        """
+        parts = self.event_parts(occurrence.event)
+        series_end = occurrence.end or (occurrence.start + timedelta(hours=1))
+        google = "{}{}&dates={}/{}".format(
+            GOOGLE_URL, parts["google"], utc_stamp(occurrence.start), utc_stamp(series_end)
+        )
+        if occurrence.repeat:
+            recur = occurrence.repeat
+            if occurrence.repeat_until:
+                recur += ";UNTIL=" + occurrence.repeat_until.strftime("%Y%m%d")
+            google += "&recur=" + urlencode(recur)
+
+        start = start or occurrence.start
+        end = end or (start + (series_end - occurrence.start))
+        outlook = "{}{}&startdt={}&enddt={}".format(
+            OUTLOOK_URL,
+            parts["outlook"],
+            urlencode(start.astimezone(utc).isoformat()),
+            urlencode(end.astimezone(utc).isoformat()),
+        )
+        return Links(google, outlook, parts["ics"])
+
+    def link_all(self, occurrence_tuples):
+        """
+        Attach the ``links`` of each (start, end, occurrence) tuple.
+        """
+        out = []
+        for occurrence_tuple in occurrence_tuples:
+            if not isinstance(occurrence_tuple, OccurrenceTuple):
+                occurrence_tuple = OccurrenceTuple(occurrence_tuple)
+            start, end, occurrence = occurrence_tuple
+            occurrence_tuple.links = self.links(occurrence, start, end)
+            out.append(occurrence_tuple)
+        return out
+
+
+def for_request(request):
+    """
+    The ``CalendarLinks`` of a request, shared by everything it renders.
+    """
+    if request is None:
+        return CalendarLinks()
+    if not hasattr(request, "_calendar_links"):
+        request._calendar_links = CalendarLinks(request)
+    return request._calendar_links
+
+
+def ics_calendar(event, occurrences, request=None):
+    """
+    An iCalendar file with a VEVENT for each occurrence of an event. Dates
+    are local so repetitions keep their time of the day across DST changes,
+    the VTIMEZONE tells their offsets over the years they span.
+    """
+    occurrences = list(occurrences)
+    tzid = get_current_timezone_name()
+    url = for_request(request).absolute_uri(event_path("event_detail", event.slug))
+    host = request.get_host() if request is not None else "mezzanine-events"
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//mezzanine-events//EN"]
+    if occurrences:
+        first_year = min(localtime(o.start).year for o in occurrences)
+        last_year = None
+        if all(o.repeat_until or not o.repeat for o in occurrences):
+            last_year = max(
+                (o.repeat_until or localtime(o.end or o.start)).year for o in occurrences
+            )
+        lines += ics_timezone(get_current_timezone(), tzid, first_year, last_year)
+    for occurrence in occurrences:
+        end = occurrence.end or (occurrence.start + timedelta(hours=1))
+        lines += [
+            "BEGIN:VEVENT",
+            "UID:occurrence-{}@{}".format(occurrence.pk, host),
+            "DTSTAMP:" + utc_stamp(now()),
+            "DTSTART;TZID={}:{}".format(
+                tzid, localtime(occurrence.start).strftime("%Y%m%dT%H%M%S")
+            ),
+            "DTEND;TZID={}:{}".format(tzid, localtime(end).strftime("%Y%m%dT%H%M%S")),
+        ]
+        if occurrence.repeat:
+            rule = occurrence.repeat.split(":", 1)[-1]
+            if occurrence.repeat_until:
+                until = make_aware(datetime.combine(occurrence.repeat_until, datetime.max.time()))
+                rule += ";UNTIL=" + utc_stamp(until)
+            lines.append("RRULE:" + rule)
+        lines += [
+            "SUMMARY:" + ics_escape(event.title),
+            "LOCATION:" + ics_escape(event.location),
+            "URL:" + url,
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(ics_fold(line) for line in lines) + "\r\n"
@@ -0,0 +1,58 @@
+"""
+Bounded thread pool used by the views to run independent queries at the same time.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+from django.utils import timezone, translation
+
+from mezzanine.conf import settings
+from mezzanine.utils.sites import current_site_id, override_current_site_id
+
+from .routing import read_database, reading_from
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    The shared thread pool, or ``None`` when ``EVENTS_THREAD_POOL_SIZE`` is zero.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None and settings.EVENTS_THREAD_POOL_SIZE:
+            _executor = ThreadPoolExecutor(max_workers=settings.EVENTS_THREAD_POOL_SIZE)
+    return _executor
+
+
+def run_concurrently(*funcs):
+    """
+    Call all the functions and return their results in the same order.
+    The first one runs in the current thread and the rest in the thread pool,
+    with the same current site, timezone, language and database as the caller.
+    """
+    executor = get_executor()
+    if executor is None or len(funcs) < 2:
+        return [func() for func in funcs]
+
+    site_id = current_site_id()
+    tz = timezone.get_current_timezone()
+    language = translation.get_language()
+    alias = read_database()
+
+    def call(func):
+        close_old_connections()
+        try:
+            with override_current_site_id(site_id), timezone.override(tz):
+                with translation.override(language), reading_from(alias):
+                    return func()
+        finally:
+            close_old_connections()
+
+    futures = [executor.submit(call, func) for func in funcs[1:]]
+    return [funcs[0]()] + [future.result() for future in futures]
@@ -0,0 +1,90 @@
+"""
+Detection of occurrences that overlap at the same location.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from collections import namedtuple
+from datetime import timedelta
+from heapq import heappop, heappush
+
+from eventtools.models import as_datetime
+
+from mezzanine.conf import settings
+from mezzanine.utils.sites import current_site_id
+
+from .expansion import get_expander
+from .models import Occurrence
+
+# Occurrences without an end are considered to last this long
+DEFAULT_DURATION = timedelta(hours=1)
+
+Conflict = namedtuple("Conflict", "start end occurrence proposed_start proposed_end")
+
+
+def expand(occurrences, from_date, to_date):
+    """
+    All (start, end, occurrence) tuples between two dates, with an end set.
+    """
+    expander = get_expander()
+    out = []
+    for occurrence in occurrences:
+        for start, end, data in expander.expand(occurrence, from_date, to_date, limit=None):
+            out.append((start, end or start + DEFAULT_DURATION, data))
+    return out
+
+
+def sweep(existing, proposed):
+    """
+    Find the overlapping pairs of two lists of (start, end, data) tuples.
+    Intervals are visited in start order while keeping the ones still open
+    in a heap ordered by end, so each pair is found when the later one starts.
+    """
+    EXISTING, PROPOSED = 0, 1
+    points = [(t[0], EXISTING, i) for i, t in enumerate(existing)]
+    points += [(t[0], PROPOSED, i) for i, t in enumerate(proposed)]
+    points.sort()
+    intervals = (existing, proposed)
+    active = ([], [])
+    pairs = []
+
+    for start, side, i in points:
+        other = active[1 - side]
+        while other and other[0][0] <= start:
+            heappop(other)
+        for _, j in other:
+            pair = (i, j) if side == EXISTING else (j, i)
+            pairs.append(pair)
+        heappush(active[side], (intervals[side][i][1], i))
+    return pairs
+
+
+def find_conflicts(location, start, end=None, repeat="", repeat_until=None, exclude_event=None):
+    """
+    Instances of other events at ``location`` (in the current site) that
+    overlap a proposed occurrence. Repetitions without ``repeat_until`` are
+    checked for the next ``EVENTS_CONFLICT_HORIZON`` days.
+    """
+    if not location or not start:
+        return []
+
+    proposal = Occurrence(start=start, end=end, repeat=repeat or "", repeat_until=repeat_until)
+    if not repeat:
+        last = end or start + DEFAULT_DURATION
+    elif repeat_until:
+        last = as_datetime(repeat_until, True) + ((end - start) if end else DEFAULT_DURATION)
+    else:
+        last = start + timedelta(days=settings.EVENTS_CONFLICT_HORIZON)
+
+    candidates = Occurrence.objects.filter(site_id=current_site_id(), event__location=location)
+    if exclude_event is not None:
+        candidates = candidates.exclude(event=exclude_event)
+    candidates = candidates.select_related("event").for_period(start, last)
+
+    existing = expand(candidates, start, last)
+    proposed = expand([proposal], start, last)
+    conflicts = [
+        Conflict(existing[i][0], existing[i][1], existing[i][2], proposed[j][0], proposed[j][1])
+        for i, j in sweep(existing, proposed)
+    ]
+    conflicts.sort(key=lambda c: (c.proposed_start, c.start))
+    return conflicts
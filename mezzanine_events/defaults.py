@@ -17,3 +17,119 @@ register_setting(
     editable=True,
     default=10,
 )
+
+register_setting(
+    name="EVENTS_CACHE_SECONDS",
+    description="Number of seconds calendar data is cached for, per site. "
+    "Only used when Mezzanine's cache middleware is installed.",
+    editable=False,
+    default=300,
+)
+
+register_setting(
+    name="EVENTS_EXPANSION_ENGINE",
+    description="Dotted path to the class that expands repeating occurrences.",
+    editable=False,
+    default="mezzanine_events.expansion.Expander",
+)
+
+register_setting(
+    name="EVENTS_CONFLICT_HORIZON",
+    description="Number of days checked for location conflicts when an occurrence "
+    "repeats without an end date.",
+    editable=False,
+    default=365,
+)
+
+register_setting(
+    name="EVENTS_COUNT_HORIZON",
+    description="Number of days after its start that the repetitions of an occurrence "
+    "without an end date are counted in the archive. Run rebuild_occurrence_counts "
+    "after changing it.",
+    editable=False,
+    default=3650,
+)
+
+register_setting(
+    name="EVENTS_THREAD_POOL_SIZE",
+    description="Number of threads the views use to run independent queries "
+    "concurrently. Zero runs everything in the request thread. Each thread has "
+    "its own database connection, with CONN_MAX_AGE=0 every task opens a new one.",
+    editable=False,
+    default=0,
+)
+
+register_setting(
+    name="EVENTS_LISTING_RECORDS",
+    description="List occurrences as compact records with just the columns the "
+    "listings need, instead of model instances. Templates of the calendar pages and "
+    "upcoming_occurrences then only get the id, site_id, title, slug, description, "
+    "location, link, featured, featured_image, latitude and longitude of events, "
+    "and the id, event, start, end, repeat and repeat_until of occurrences.",
+    editable=False,
+    default=False,
+)
+
+register_setting(
+    name="EVENTS_WARM_CACHE_ON_SAVE",
+    description="Render the pages of an event again in the background after it's "
+    "saved, so visitors don't find them uncached.",
+    editable=False,
+    default=False,
+)
+
+register_setting(
+    name="EVENTS_GEOCODER",
+    description="Dotted path to the class that looks up the coordinates of event addresses.",
+    editable=False,
+    default="mezzanine_events.geo.TableGeocoder",
+)
+
+register_setting(
+    name="EVENTS_GEOCODER_TABLE",
+    description="Coordinates of known addresses, as a dict of addresses to (latitude, "
+    "longitude) pairs. Used by the default geocoder.",
+    editable=False,
+    default={},
+)
+
+register_setting(
+    name="EVENTS_NEARBY_MAX_RADIUS",
+    description="Largest radius in km of the nearby events search.",
+    editable=False,
+    default=200,
+)
+
+register_setting(
+    name="EVENTS_ARCHIVE_DAYS",
+    description="Number of days after they end that archive_past_occurrences moves "
+    "occurrences out of the live table. Listings only read the archive for periods "
+    "starting before then, restore the archived occurrences before increasing it.",
+    editable=False,
+    default=365,
+)
+
+register_setting(
+    name="EVENTS_READ_DATABASE",
+    description="Database alias the read-only calendar pages and template tags read "
+    "from, e.g. a replica. Requires mezzanine_events.routing.ReplicaRouter in "
+    "DATABASE_ROUTERS. Empty reads from the default database.",
+    editable=False,
+    default="",
+)
+
+register_setting(
+    name="EVENTS_READ_DATABASE_LAG",
+    description="Number of seconds staff read from the default database after saving "
+    "an event in the admin, while EVENTS_READ_DATABASE catches up.",
+    editable=False,
+    default=10,
+)
+
+register_setting(
+    name="EVENTS_RECOMMENDATION_COUNT",
+    description="Number of similar upcoming events update_event_recommendations "
+    "stores for each event.",
+    editable=False,
+    default=5,
+)
@@ -18,6 +18,7 @@ from mezzanine.utils.admin import admin_url
 from mezzanine.utils.sites import current_site_id
 
 from .models import Event
+from .routing import remember_write
 from .utils import convert
 
 
@@ -113,10 +114,15 @@ class EventImportMixin(object):
             occ.save()
 
         # Import occurrences (if available)
-        for occ_data in data.get("occurrences", []):
-            occ = occ_data["fields"].copy()
-            occ.pop("event")
-            event.occurrences.create(**occ)
+        # Deserialized so the dates are parsed, the site is taken from the new event
+        occurrences = deserialize(
+            "json", json.dumps(data.get("occurrences", [])), ignorenonexistent=True
+        )
+        for occ in occurrences:
+            occ = occ.object
+            occ.id = None
+            occ.event = event
+            occ.save()
 
         return event
 
@@ -148,6 +154,7 @@ class EventImportMixin(object):
             return fail(str(e))
 
         event = self.create_event(data, data_url=url, user=request.user)
+        remember_write(request)
 
         self.message_user(request, "Event imported successfully")
         return redirect(admin_url(Event, "change", event.pk))
@@ -0,0 +1,328 @@
+"""
+Expansion of repeating occurrences into (start, end, occurrence) tuples.
+
+The four frequencies offered by ``Occurrence.repeat`` are expanded with plain
+date arithmetic instead of iterating a dateutil rrule, but the output is the
+same as the expansion of django-eventtools: repetitions keep their wall-clock
+time in the current timezone, days that don't exist in a month or year
+(the 31st, February 29th) are skipped and at most ``limit`` tuples are returned
+per occurrence. Other repeat rules are delegated to dateutil.
+
+Unlike django-eventtools, repetitions whose wall-clock time is skipped or
+repeated by a DST change don't raise: they are resolved like RFC 5545 does.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+from bisect import bisect_right
+from calendar import monthrange
+from datetime import date, datetime, time, timedelta
+from operator import itemgetter
+
+import pytz
+from dateutil import rrule
+
+from eventtools.models import (
+    REPEAT_MAX,
+    as_datetime,
+    default_aware,
+    default_naive,
+    max_future_date,
+)
+
+from django.utils.timezone import get_current_timezone, make_aware, utc
+
+from mezzanine.conf import settings
+from mezzanine.utils.importing import import_dotted_path
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DAILY = "RRULE:FREQ=DAILY"
+WEEKLY = "RRULE:FREQ=WEEKLY"
+MONTHLY = "RRULE:FREQ=MONTHLY"
+YEARLY = "RRULE:FREQ=YEARLY"
+
+# Number of days or months between repetitions
+DAY_STEPS = {DAILY: 1, WEEKLY: 7}
+MONTH_STEPS = {MONTHLY: 1, YEARLY: 12}
+
+
+def month_index(dt):
+    """
+    Months elapsed since year zero, handy for month arithmetic.
+    """
+    return dt.year * 12 + dt.month - 1
+
+
+def month_start(index):
+    """
+    First day of the month with the given ``month_index``.
+    """
+    year, month = divmod(index, 12)
+    return date(year, month + 1, 1)
+
+
+def covered_months(occurrence):
+    """
+    First days of the UTC months that the repetitions of an occurrence can
+    overlap, and how often (in months) they keep repeating afterwards.
+    Only repetitions without ``repeat_until`` keep repeating forever.
+
+    Repetitions keep their wall-clock time in the timezone they are expanded
+    in, so they can be a few hours away from the months found here. Periods
+    are padded by a day when looking them up, see ``for_period()``.
+    """
+    start = occurrence.start.astimezone(utc)
+    end = occurrence.end.astimezone(utc) if occurrence.end else start
+    first = month_index(start)
+    span = month_index(end) - first
+    every = 0
+
+    if not occurrence.repeat:
+        indexes = range(first, first + span + 1)
+    elif not occurrence.repeat_until:
+        if occurrence.repeat == YEARLY:
+            indexes, every = range(first, first + span + 1), 12
+        else:
+            indexes, every = [first], 1
+    elif occurrence.repeat == YEARLY:
+        indexes = set()
+        for year in range(start.year, occurrence.repeat_until.year + 1):
+            year_first = year * 12 + start.month - 1
+            indexes.update(range(year_first, year_first + span + 1))
+        indexes = sorted(indexes)
+    else:
+        # The last day ends at most a day later in UTC, whatever the timezone
+        last_day = datetime.combine(occurrence.repeat_until, time.max) + timedelta(days=1)
+        indexes = range(first, month_index(last_day + (end - start)) + 1)
+    return [month_start(i) for i in indexes], every
+
+
+def microseconds(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def localize(dt, tz):
+    """
+    Make a naive datetime aware in ``tz``. Times skipped by a DST change use
+    the offset from before it, times it repeats are the first of them.
+    """
+    try:
+        return make_aware(dt, tz)
+    except pytz.NonExistentTimeError:
+        return tz.normalize(make_aware(dt, tz, is_dst=False))
+    except pytz.AmbiguousTimeError:
+        return make_aware(dt, tz, is_dst=True)
+
+
+def localize_all(datetimes):
+    """
+    Make sorted naive datetimes aware with ``localize()``, if tz support is
+    enabled. Localizing is the most expensive part of the expansion, so the
+    UTC offset is reused for dates that are more than a day away from a DST
+    transition of the timezone.
+    """
+    if not settings.USE_TZ:
+        return list(datetimes)
+    tz = get_current_timezone()
+    # Private to pytz timezones with DST, others localize every date
+    transitions = getattr(tz, "_utc_transition_times", None)
+    if not isinstance(transitions, list) or not transitions:
+        return [localize(dt, tz) for dt in datetimes]
+
+    out = []
+    margin = timedelta(days=1)
+    tzinfo = lower = upper = None
+    for dt in datetimes:
+        if tzinfo is not None and lower <= dt <= upper:
+            out.append(dt.replace(tzinfo=tzinfo))
+            continue
+        aware = localize(dt, tz)
+        out.append(aware)
+        offset = aware.utcoffset()
+        i = bisect_right(transitions, dt - offset)
+        if 0 < i < len(transitions):
+            tzinfo = aware.tzinfo
+            lower = transitions[i - 1] + (offset + margin)
+            upper = transitions[i] + (offset - margin)
+        else:
+            tzinfo = None  # Outside the transition table, always use pytz
+    return out
+
+
+class Expander(object):
+    """
+    Computes the repetitions of occurrences. Set ``EVENTS_EXPANSION_ENGINE``
+    to the dotted path of a subclass to customize the expansion.
+    """
+
+    # Use NumPy when an occurrence can produce more repetitions than this
+    numpy_threshold = 1000
+
+    def starts(self, repeat, dtstart, lower, upper, limit=None):
+        """
+        Naive start datetimes of the repetitions of ``repeat`` that fall between
+        ``lower`` and ``upper`` (inclusive), up to ``limit`` items.
+        """
+        dtstart = dtstart.replace(microsecond=0)  # Same as dateutil
+        lower = max(lower, dtstart)
+        if upper < lower:
+            return []
+        if repeat in DAY_STEPS:
+            return self.day_starts(DAY_STEPS[repeat], dtstart, lower, upper, limit)
+        if repeat in MONTH_STEPS:
+            return self.month_starts(MONTH_STEPS[repeat], dtstart, lower, upper, limit)
+        repeater = rrule.rrulestr(repeat, dtstart=dtstart).between(lower, upper, inc=True)
+        return repeater[:limit]
+
+    def day_starts(self, days, dtstart, lower, upper, limit):
+        step = microseconds(timedelta(days=days))
+        first = -(-microseconds(lower - dtstart) // step)
+        count = microseconds(upper - dtstart) // step - first + 1
+        if limit is not None:
+            count = min(count, limit)
+        if numpy is not None and count > self.numpy_threshold:
+            offsets = (numpy.arange(first, first + count) * days).astype("timedelta64[D]")
+            return (numpy.datetime64(dtstart, "us") + offsets).tolist()
+        return [dtstart + timedelta(days=days * i) for i in range(first, first + count)]
+
+    def month_starts(self, months, dtstart, lower, upper, limit):
+        origin = month_index(dtstart)
+        first = -(-(month_index(lower) - origin) // months)
+        last = (month_index(upper) - origin) // months
+        if numpy is not None and (last - first) > self.numpy_threshold:
+            return self.numpy_month_starts(months, dtstart, lower, upper, limit, first, last)
+
+        out = []
+        for i in range(first, last + 1):
+            year, month = divmod(origin + i * months, 12)
+            if dtstart.day > monthrange(year, month + 1)[1]:
+                continue
+            dt = dtstart.replace(year=year, month=month + 1)
+            if lower <= dt <= upper:
+                out.append(dt)
+                if len(out) == limit:
+                    break
+        return out
+
+    def numpy_month_starts(self, months, dtstart, lower, upper, limit, first, last):
+        month_starts = numpy.datetime64(dtstart.replace(day=1).date(), "M") + (
+            numpy.arange(first, last + 1) * months
+        ).astype("timedelta64[M]")
+        days = month_starts.astype("datetime64[D]") + numpy.timedelta64(dtstart.day - 1, "D")
+        # Days past the end of the month roll into the next one, skip them
+        days = days[days.astype("datetime64[M]") == month_starts]
+        time_of_day = dtstart - datetime.combine(dtstart.date(), datetime.min.time())
+        starts = days.astype("datetime64[us]") + numpy.timedelta64(microseconds(time_of_day), "us")
+        starts = starts[
+            (starts >= numpy.datetime64(lower, "us")) & (starts <= numpy.datetime64(upper, "us"))
+        ]
+        return starts[:limit].tolist()
+
+    def expand(self, occurrence, from_date=None, to_date=None, limit=REPEAT_MAX):
+        """
+        Generate the (start, end, occurrence_data) tuples of an occurrence
+        between two dates.
+        """
+        start, end = occurrence.start, occurrence.end
+        if not start:
+            return
+
+        from_date = from_date and as_datetime(from_date)
+        to_date = to_date and as_datetime(to_date, True)
+
+        if not occurrence.repeat:
+            if (not from_date or start >= from_date or (end and end >= from_date)) and (
+                not to_date or start <= to_date
+            ):
+                yield (start, end, occurrence.occurrence_data)
+            return
+
+        delta = (end - start) if end else timedelta(0)
+        data = occurrence.occurrence_data
+        for occ_start in localize_all(self.repeat_starts(occurrence, from_date, to_date, limit)):
+            yield (occ_start, occ_start + delta, data)
+
+    def repeat_starts(self, occurrence, from_date=None, to_date=None, limit=REPEAT_MAX):
+        """
+        Naive local start datetimes of the repetitions of a repeating occurrence
+        that overlap the period between two dates.
+        """
+        start, end = occurrence.start, occurrence.end
+        delta = (end - start) if end else timedelta(0)
+        from_date = from_date and as_datetime(from_date)
+        to_date = to_date and as_datetime(to_date, True)
+
+        # Start from the first occurrence at the earliest
+        if not from_date or from_date < start:
+            from_date = start
+
+        # Look until the last occurrence, up to an arbitrary maximum date
+        repeat_until = occurrence.repeat_until and as_datetime(occurrence.repeat_until, True)
+        if repeat_until and (not to_date or repeat_until < to_date):
+            to_date = repeat_until
+        elif not to_date:
+            to_date = default_aware(max_future_date())
+
+        # Start is used for the filter, take the occurrence length into account
+        from_date -= delta
+
+        return self.starts(
+            occurrence.repeat,
+            default_naive(start),
+            default_naive(from_date),
+            default_naive(to_date),
+            limit,
+        )
+
+    def expand_all(self, occurrences, from_date=None, to_date=None, limit=None):
+        """
+        Expand many occurrences at once, sorted by start date.
+        Ties keep the order of ``occurrences``, as in django-eventtools.
+        """
+        out = []
+        for occurrence in occurrences:
+            out.extend(self.expand(occurrence, from_date, to_date))
+        out.sort(key=itemgetter(0))
+        return out[:limit]
+
+
+def event_dates(occurrences, when):
+    """
+    Start of the first repetition that hasn't ended by ``when`` and end of
+    the last repetition of some occurrences. The end is None when one of
+    them repeats forever, the start when none of them is current.
+    """
+    expander = get_expander()
+    next_start = last_end = None
+    forever = False
+    for occurrence in occurrences:
+        for start, end, data in expander.expand(occurrence, when, limit=1):
+            if next_start is None or start < next_start:
+                next_start = start
+        if occurrence.repeat and not occurrence.repeat_until:
+            forever = True
+        elif not forever:
+            end = occurrence.end or occurrence.start
+            if occurrence.repeat:
+                # Only the last repetition needs to be made aware
+                starts = expander.repeat_starts(occurrence, limit=None)
+                end = localize_all(starts[-1:])[0] + (end - occurrence.start) if starts else None
+            if end and (last_end is None or end > last_end):
+                last_end = end
+    return next_start, None if forever else last_end
+
+
+_expanders = {}
+
+
+def get_expander():
+    """
+    Return the expander configured with ``EVENTS_EXPANSION_ENGINE``.
+    """
+    path = settings.EVENTS_EXPANSION_ENGINE
+    if path not in _expanders:
+        _expanders[path] = import_dotted_path(path)()
+    return _expanders[path]
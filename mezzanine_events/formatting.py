@@ -0,0 +1,119 @@
+"""
+Formatting of occurrence dates for display, memoized per language and timezone.
+
+Localized datetime formats are split where their time-dependent part starts.
+The date part is formatted once per day and the time part once per time of
+day, so a page of occurrences only formats a few distinct strings.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from datetime import datetime
+
+from django.utils import dateformat, formats, timezone, translation
+
+# Specifiers that also depend on the time of the day, besides those of TimeFormat
+DATETIME_SPECIFIERS = set("IcrU")
+
+# Discard cached strings past this size, the formatter lives as long as the process
+MAX_CACHED = 10000
+
+
+def split_format(format_string):
+    """
+    Split a format into its date-only prefix and the rest, and tell whether
+    the rest also depends on the date.
+    """
+    matches = list(dateformat.re_formatchars.finditer(format_string))
+    for i, match in enumerate(matches):
+        specifier = match.group(1)
+        if hasattr(dateformat.TimeFormat, specifier) or specifier in DATETIME_SPECIFIERS:
+            position = match.start()
+            by_date = any(not hasattr(dateformat.TimeFormat, m.group(1)) for m in matches[i:])
+            return format_string[:position], format_string[position:], by_date
+    return format_string, "", False
+
+
+class OccurrenceTuple(tuple):
+    """
+    A (start, end, occurrence) tuple with its formatted ``label``. Other
+    attributes are attached by ``CalendarLinks.link_all()`` (``links``) and
+    nearby searches (``distance``).
+    """
+
+    def __new__(cls, occurrence_tuple, label=""):
+        obj = super(OccurrenceTuple, cls).__new__(cls, occurrence_tuple)
+        obj.label = label
+        return obj
+
+
+class DurationFormatter(object):
+    """
+    Formats datetimes and intervals like the ``date`` template filter with
+    ``DATETIME_FORMAT`` and ``TIME_FORMAT``, for a language and a timezone.
+    """
+
+    def __init__(self, language, tz):
+        self.tz = tz
+        with translation.override(language):
+            self.datetime_format = split_format(formats.get_format("DATETIME_FORMAT"))
+            self.time_format = split_format(formats.get_format("TIME_FORMAT"))
+        self.cache = {}
+
+    def format(self, value, format_parts):
+        """
+        Format a local datetime with a format from ``split_format()``.
+        """
+        prefix, rest, by_date = format_parts
+        day_key = (prefix, value.date())
+        if rest and by_date:
+            time_key = (rest, value.replace(tzinfo=None), value.utcoffset())
+        else:
+            time_key = (rest, value.time(), value.utcoffset(), value.tzname())
+        # Other threads can clear the cache at any time, never read a key twice
+        cache = self.cache
+        if len(cache) > MAX_CACHED:
+            cache.clear()
+        out = ""
+        for key, part in ((day_key, prefix), (time_key, rest)):
+            formatted = cache.get(key)
+            if formatted is None:
+                formatted = cache.setdefault(key, dateformat.format(value, part) if part else "")
+            out += formatted
+        return out
+
+    def duration(self, start, end=None):
+        """
+        Human readable representation of a time interval.
+        """
+        if not isinstance(start, datetime):
+            return ""
+
+        local_start = timezone.localtime(start, self.tz)
+        out = self.format(local_start, self.datetime_format)
+        if end not in (None, start):
+            local_end = timezone.localtime(end, self.tz)
+            if local_end.date() == local_start.date():
+                out += " to {}".format(self.format(local_end, self.time_format))
+            else:
+                out += " to {}".format(self.format(local_end, self.datetime_format))
+        return out
+
+    def label_all(self, occurrence_tuples):
+        """
+        Attach the duration label to (start, end, occurrence) tuples.
+        """
+        return [OccurrenceTuple(t, self.duration(t[0], t[1])) for t in occurrence_tuples]
+
+
+_formatters = {}
+
+
+def get_formatter():
+    """
+    The formatter for the current language and timezone.
+    """
+    key = (translation.get_language(), timezone.get_current_timezone())
+    formatter = _formatters.get(key)
+    if formatter is None:
+        formatter = _formatters.setdefault(key, DurationFormatter(*key))
+    return formatter
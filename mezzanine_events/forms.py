@@ -1,9 +1,30 @@
 from __future__ import absolute_import, unicode_literals
 
+from datetime import datetime, time
+
 from django import forms
+from django.forms.models import BaseInlineFormSet
+from django.utils.timezone import make_aware
+
+from mezzanine.conf import settings
 
-from .models import EventCategory
-from .utils import today
+from .conflicts import find_conflicts
+from .models import Event, EventCategory, Occurrence
+from .utils import duration_info, today
+
+
+def conflict_message(conflicts, limit=3):
+    """
+    Describe the first conflicts of an occurrence for the user.
+    """
+    out = "Overlaps with other events at the same location: "
+    out += "; ".join(
+        "{} ({})".format(c.occurrence.event.title, duration_info(c.start, c.end))
+        for c in conflicts[:limit]
+    )
+    if len(conflicts) > limit:
+        out += " and {} more".format(len(conflicts) - limit)
+    return out
 
 
 class GridFilterForm(forms.Form):
@@ -24,9 +45,17 @@ class GridFilterForm(forms.Form):
         categories = self.cleaned_data["categories"]
 
         if categories:
-            qs = qs.filter(event__categories__in=categories)
+            # Joining the categories would repeat the events in several of them
+            events = Event.categories.through.objects.filter(eventcategory__in=categories)
+            qs = qs.filter(event_id__in=events.values("event_id"))
         return qs
 
+    def cache_parts(self):
+        """
+        Values that identify the filtered results in the cache.
+        """
+        return sorted(category.pk for category in self.cleaned_data["categories"])
+
 
 class ListFilterForm(GridFilterForm):
     """
@@ -55,3 +84,84 @@ class ListFilterForm(GridFilterForm):
 
         cleaned_data.update({"start_day": start, "end_day": end})
         return cleaned_data
+
+    def cache_parts(self):
+        parts = super(ListFilterForm, self).cache_parts()
+        return [self.cleaned_data["start_day"], self.cleaned_data["end_day"]] + parts
+
+
+class ConflictCheckForm(forms.Form):
+    """
+    Proposed occurrence to check for conflicts at a location.
+    """
+
+    location = forms.CharField()
+    start = forms.DateTimeField()
+    end = forms.DateTimeField(required=False)
+    repeat = forms.ChoiceField(
+        choices=Occurrence._meta.get_field("repeat").choices, required=False
+    )
+    repeat_until = forms.DateField(required=False)
+    exclude_event = forms.IntegerField(required=False)
+
+    def conflicts(self):
+        return find_conflicts(**self.cleaned_data)
+
+
+class NearbyForm(forms.Form):
+    """
+    Point and radius of a nearby events search.
+    """
+
+    lat = forms.FloatField(min_value=-90, max_value=90)
+    lng = forms.FloatField(min_value=-180, max_value=180)
+    radius = forms.FloatField(min_value=0, required=False, initial=10)
+    end_day = forms.DateField(input_formats=["%m/%d/%Y"], required=False)
+    limit = forms.IntegerField(min_value=1, max_value=100, required=False)
+
+    def clean_radius(self):
+        radius = self.cleaned_data["radius"]
+        if radius is None:
+            radius = self.fields["radius"].initial
+        if radius > settings.EVENTS_NEARBY_MAX_RADIUS:
+            raise forms.ValidationError(
+                "The radius can't be larger than %s km" % settings.EVENTS_NEARBY_MAX_RADIUS
+            )
+        return radius
+
+    def occurrences(self):
+        data = self.cleaned_data
+        end = data["end_day"] and make_aware(datetime.combine(data["end_day"], time.max))
+        return Occurrence.objects.published().nearby(
+            data["lat"], data["lng"], data["radius"], to_date=end, limit=data["limit"] or 20
+        )
+
+
+class OccurrenceInlineFormSet(BaseInlineFormSet):
+    """
+    Don't allow occurrences that overlap other events at the same location.
+    """
+
+    def clean(self):
+        super(OccurrenceInlineFormSet, self).clean()
+        if any(self.errors):
+            return
+
+        event = self.instance
+        location_changed = not Event.objects.filter(pk=event.pk, location=event.location).exists()
+        for form in self.forms:
+            data = form.cleaned_data
+            if not data or data.get("DELETE"):
+                continue
+            if not (location_changed or form.has_changed()):
+                continue
+            conflicts = find_conflicts(
+                event.location,
+                data["start"],
+                data.get("end"),
+                data.get("repeat"),
+                data.get("repeat_until"),
+                exclude_event=event.pk,
+            )
+            if conflicts:
+                form.add_error(None, conflict_message(conflicts))
@@ -0,0 +1,153 @@
+"""
+Coordinates of events: geohashes to look them up by area, distances, and
+geocoders that turn addresses into coordinates.
+
+Events store the geohash of their coordinates. Every point within a radius
+of a center is in the cell of the center or in one of its eight neighbours,
+when the cells are at least as large as the radius, so a radius search only
+scans the events under those nine prefixes.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from math import asin, cos, radians, sin, sqrt
+
+from django.apps import apps
+
+from mezzanine.conf import settings
+from mezzanine.utils.importing import import_dotted_path
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Stored precision, cells of about 5 x 5 meters
+PRECISION = 9
+EARTH_RADIUS = 6371.0  # km
+KM_PER_DEGREE = 111.32
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """
+    Geohash of a point.
+    """
+    longitude = (longitude + 180) % 360 - 180
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    out = []
+    bits = bit_count = 0
+    even = True
+    while len(out) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            out.append(BASE32[bits])
+            bits = bit_count = 0
+    return "".join(out)
+
+
+def cell_size(precision):
+    """
+    Height and width of the cells of a precision, in degrees.
+    """
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2**lat_bits, 360.0 / 2**lon_bits
+
+
+def search_precision(latitude, radius):
+    """
+    The longest precision whose cells are at least ``radius`` km high and
+    wide at a latitude, None when not even the largest cells are.
+    """
+    # Cells get narrower towards the poles, measure them at the edge closest to one
+    widest = min(abs(latitude) + radius / KM_PER_DEGREE, 90)
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        if min(height, width * cos(radians(widest))) * KM_PER_DEGREE >= radius:
+            return precision
+    return None
+
+
+def neighbours(latitude, longitude, precision):
+    """
+    Geohashes of the cell of a point and of the cells around it.
+    """
+    height, width = cell_size(precision)
+    cells = set()
+    for dlat in (-height, 0, height):
+        lat = latitude + dlat
+        if -90 <= lat <= 90:
+            for dlon in (-width, 0, width):
+                cells.add(encode(lat, longitude + dlon, precision))
+    return sorted(cells)
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """
+    Great circle distance between two points, in km.
+    """
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(min(1, sqrt(a)))
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+class TableGeocoder(object):
+    """
+    Looks up addresses in ``EVENTS_GEOCODER_TABLE``, a dict of addresses to
+    (latitude, longitude) pairs. Works offline, e.g. for venues that are used often.
+    """
+
+    def __init__(self):
+        self.table = dict(
+            (normalize_query(query), coordinates)
+            for query, coordinates in settings.EVENTS_GEOCODER_TABLE.items()
+        )
+
+    def geocode(self, query):
+        """
+        (latitude, longitude) of an address, None if it's unknown.
+        """
+        return self.table.get(normalize_query(query))
+
+
+_geocoders = {}
+
+
+def get_geocoder():
+    """
+    Return the geocoder configured with ``EVENTS_GEOCODER``.
+    """
+    path = settings.EVENTS_GEOCODER
+    geocoder = _geocoders.get(path)
+    if geocoder is None:
+        geocoder = _geocoders.setdefault(path, import_dotted_path(path)())
+    return geocoder
+
+
+def geocode(query):
+    """
+    Coordinates of an address, through a local cache of the geocoder's
+    answers. Unknown addresses are cached too, delete their ``GeocodeCache``
+    rows to look them up again.
+    """
+    GeocodeCache = apps.get_model("mezzanine_events", "GeocodeCache")
+    query = normalize_query(query)[:255]
+    if not query:
+        return None
+    cached = GeocodeCache.objects.filter(query=query).first()
+    if cached is None:
+        coordinates = get_geocoder().geocode(query) or (None, None)
+        cached = GeocodeCache.objects.create(
+            query=query, latitude=coordinates[0], longitude=coordinates[1]
+        )
+    if cached.latitude is None:
+        return None
+    return cached.latitude, cached.longitude
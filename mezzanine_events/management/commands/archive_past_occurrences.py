@@ -0,0 +1,28 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from mezzanine_events.partition import archive_occurrences, restore_occurrences
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the occurrences that ended more than EVENTS_ARCHIVE_DAYS ago to the archive "
+        "table. Meant to be run periodically, e.g. every night from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500, help="Occurrences moved per transaction"
+        )
+        parser.add_argument(
+            "--restore", action="store_true", help="Move all the archived occurrences back"
+        )
+
+    def handle(self, *args, **options):
+        if options["restore"]:
+            count = restore_occurrences(options["batch_size"])
+            self.stdout.write("Restored {} occurrences".format(count))
+        else:
+            count = archive_occurrences(batch_size=options["batch_size"])
+            self.stdout.write("Archived {} occurrences".format(count))
@@ -0,0 +1,33 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mezzanine_events.benchmarks import BENCHMARKS
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Run a calendar benchmark on throwaway data"
+
+    def add_arguments(self, parser):
+        parser.add_argument("benchmark", choices=list(BENCHMARKS), help="Benchmark to run")
+        parser.add_argument(
+            "--size", type=int, default=200, help="Number of events created per data set"
+        )
+
+    def handle(self, *args, **options):
+        benchmark = BENCHMARKS[options["benchmark"]]
+        self.stdout.write(" ".join(benchmark.__doc__.split()))
+        if getattr(benchmark, "commits", False):
+            benchmark(self.stdout, options["size"])
+            return
+        try:
+            with transaction.atomic():
+                benchmark(self.stdout, options["size"])
+                raise Rollback()
+        except Rollback:
+            pass
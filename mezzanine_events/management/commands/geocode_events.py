@@ -0,0 +1,31 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from mezzanine_events.caching import invalidate
+from mezzanine_events.geo import encode, geocode
+from mezzanine_events.models import Event
+
+
+class Command(BaseCommand):
+    help = "Look up the coordinates of the events that don't have them"
+
+    def handle(self, *args, **options):
+        events = Event._base_manager.filter(latitude__isnull=True)
+        found = missing = 0
+        site_ids = set()
+        rows = events.values_list("pk", "site_id", "address", "location")
+        for pk, site_id, address, location in list(rows):
+            coordinates = geocode(address or location)
+            if coordinates is None:
+                missing += 1
+                continue
+            latitude, longitude = coordinates
+            Event._base_manager.filter(pk=pk).update(
+                latitude=latitude, longitude=longitude, geohash=encode(latitude, longitude)
+            )
+            site_ids.add(site_id)
+            found += 1
+        for site_id in site_ids:
+            invalidate(site_id)
+        self.stdout.write("Geocoded {} events, {} addresses not found".format(found, missing))
@@ -0,0 +1,15 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mezzanine_events.archive import rebuild_counts
+
+
+class Command(BaseCommand):
+    help = "Count the occurrences per month again, e.g. after bulk changes"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            cells = rebuild_counts()
+        self.stdout.write("Stored {} monthly counts".format(cells))
@@ -0,0 +1,30 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from mezzanine_events.models import Event
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll the next start of events forward once it has passed. "
+        "Meant to be run periodically, e.g. every hour from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true", help="Recompute the dates of every event"
+        )
+
+    def handle(self, *args, **options):
+        when = now()
+        events = Event._base_manager.all()
+        if not options["all"]:
+            events = events.filter(next_start__lte=when)
+
+        count = 0
+        for event in events.iterator():
+            event.update_dates(when)
+            count += 1
+        self.stdout.write("Updated the dates of {} events".format(count))
@@ -0,0 +1,25 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from mezzanine_events.recommendations import update_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the similar upcoming events recommended with each event, only for the "
+        "events that changed since the last run. Meant to be run periodically, e.g. "
+        "every hour from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true", help="Recompute the recommendations of every event"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=500, help="Events written per transaction"
+        )
+
+    def handle(self, *args, **options):
+        count = update_recommendations(full=options["full"], batch_size=options["batch_size"])
+        self.stdout.write("Updated the recommendations of {} events".format(count))
@@ -0,0 +1,18 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mezzanine_events.archive import recount_published
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the occurrences of the events whose publish or expiry date has passed. "
+        "Meant to be run periodically, e.g. every hour from cron."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = recount_published()
+        self.stdout.write("Recounted {} events".format(count))
@@ -0,0 +1,70 @@
+from __future__ import absolute_import, unicode_literals
+
+from collections import OrderedDict
+from timeit import default_timer
+
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand
+
+from mezzanine.utils.cache import cache_installed
+
+from mezzanine_events.warmup import site_tasks, warm
+
+
+class Command(BaseCommand):
+    help = "Render the upcoming calendar pages of every site so they are cached"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--site", action="append", default=[], help="Domain of a site to warm (repeatable)"
+        )
+        parser.add_argument("--months", type=int, default=3, help="Number of month grids")
+        parser.add_argument("--list-pages", type=int, default=1, help="Number of list pages")
+        parser.add_argument(
+            "--events", type=int, default=50, help="Number of upcoming event detail pages"
+        )
+        parser.add_argument("--workers", type=int, default=4, help="Number of worker threads")
+
+    def handle(self, *args, **options):
+        if not cache_installed():
+            self.stderr.write("The cache middleware isn't installed, nothing will be cached")
+
+        sites = Site.objects.all()
+        if options["site"]:
+            sites = sites.filter(domain__in=options["site"])
+        tasks = []
+        for site in sites:
+            tasks += site_tasks(site, options["months"], options["list_pages"], options["events"])
+
+        start = default_timer()
+        results = warm(tasks, options["workers"])
+        elapsed = default_timer() - start
+
+        by_kind = OrderedDict()
+        for result in results:
+            by_kind.setdefault(result.task.kind, []).append(result)
+            if result.error is not None or result.status != 200:
+                self.stderr.write(
+                    "{} {}: {}".format(
+                        result.task.site.domain, result.task.label, result.error or result.status
+                    )
+                )
+            elif options["verbosity"] > 1:
+                self.stdout.write(
+                    "{} {} {:.0f}ms".format(
+                        result.task.site.domain, result.task.label, result.seconds * 1000
+                    )
+                )
+
+        self.stdout.write("kind      pages  errors  total (ms)  slowest (ms)")
+        for kind, kind_results in by_kind.items():
+            errors = sum(1 for r in kind_results if r.error is not None or r.status != 200)
+            seconds = [r.seconds for r in kind_results]
+            self.stdout.write(
+                "{:8}  {:5}  {:6}  {:10.0f}  {:12.0f}".format(
+                    kind, len(kind_results), errors, sum(seconds) * 1000, max(seconds) * 1000
+                )
+            )
+        self.stdout.write(
+            "Warmed {} pages of {} sites in {:.1f}s".format(len(results), len(sites), elapsed)
+        )
@@ -1,20 +1,42 @@
 from __future__ import absolute_import, unicode_literals
 
+from datetime import timedelta
+
+from django.apps import apps
 from django.db.models import Q
-from django.utils.timezone import now
+from django.utils.timezone import localtime, now, utc
 
 from mezzanine.core.managers import DisplayableManager, SearchableQuerySet
 from mezzanine.core.models import CONTENT_STATUS_PUBLISHED
+from mezzanine.utils.sites import current_site_id
 
 from eventtools.models import (
     EventQuerySet,
     EventManager as BaseEventManager,
     OccurrenceManager as BaseOccurrenceManager,
+    OccurrenceQuerySet as BaseOccurrenceQuerySet,
+    as_datetime,
 )
 
+from . import geo
+from .expansion import get_expander, month_index, month_start
+from .formatting import OccurrenceTuple
+from .records import load_listing
+
 
 class SearchableEventQuerySet(SearchableQuerySet, EventQuerySet):
-    pass
+    def upcoming(self):
+        """
+        Events that didn't end yet, sorted by their next start.
+        """
+        ongoing = Q(last_end__isnull=True, next_start__isnull=False)
+        return self.filter(Q(last_end__gte=now()) | ongoing).order_by("next_start")
+
+    def past(self):
+        """
+        Events that already ended, most recent first.
+        """
+        return self.filter(last_end__lt=now()).order_by("-last_end")
 
 
 class EventManager(DisplayableManager, BaseEventManager):
@@ -28,19 +50,136 @@ class EventManager(DisplayableManager, BaseEventManager):
         search_fields = self.get_search_fields()
         return SearchableEventQuerySet(self.model, search_fields=search_fields)
 
+    def upcoming(self):
+        """
+        Retrieve published events that didn't end yet.
+        """
+        return self.published().upcoming()
+
+    def past(self):
+        """
+        Retrieve published events that ended in the past.
+        """
+        return self.published().past()
+
+
+class OccurrenceQuerySet(BaseOccurrenceQuerySet):
+    def for_period(self, from_date=None, to_date=None, exact=False):
+        """
+        When both dates are set, look up the occurrences by the months they
+        cover instead of considering everything that started before the period.
+
+        Only occurrences with ``OccurrenceMonth`` rows are found this way.
+        ``Occurrence.save()`` builds them, code that skips it with
+        ``bulk_create()`` or ``update()`` must build them as well, see
+        ``OccurrenceMonth.for_occurrence()``.
+        """
+        if not (from_date and to_date) or exact:
+            return super(OccurrenceQuerySet, self).for_period(from_date, to_date, exact)
+
+        # Covered months are in UTC, repetitions can be up to a day away from them
+        margin = timedelta(days=1)
+        first = month_index(localtime(as_datetime(from_date) - margin, utc))
+        last = month_index(localtime(as_datetime(to_date, True) + margin, utc))
+        yearly_months = set(i % 12 + 1 for i in range(first, min(last, first + 11) + 1))
+        OccurrenceMonth = apps.get_model("mezzanine_events", "OccurrenceMonth")
+        last_month = month_start(last)
+        once = Q(every=0, month__range=(month_start(first), last_month))
+        monthly = Q(every=1, month__lte=last_month)
+        yearly = Q(every=12, month__lte=last_month, month__month__in=yearly_months)
+        months = OccurrenceMonth.objects.filter(once | monthly | yearly)
+        return self.filter(pk__in=months.values("occurrence_id"))
+
+    def all_occurrences(self, from_date=None, to_date=None, limit=None):
+        """
+        Expand all the occurrences in a single batch, instead of merging
+        one generator per occurrence.
+        """
+        qs = self.for_period(from_date, to_date)
+        return iter(get_expander().expand_all(qs, from_date, to_date, limit))
+
+    def listing(self, from_date=None, to_date=None, limit=None):
+        """
+        Same as ``all_occurrences()`` with the events loaded in the same query,
+        and compact records instead of model instances when ``EVENTS_LISTING_RECORDS`` is set.
+        """
+        occurrences = load_listing(self.for_period(from_date, to_date))
+        return iter(get_expander().expand_all(occurrences, from_date, to_date, limit))
+
+    def near(self, latitude, longitude, radius):
+        """
+        Occurrences of events in the geohash cells that cover a radius in km
+        around a point. Some of them can be farther than the radius.
+        """
+        precision = geo.search_precision(latitude, radius)
+        if precision is None:
+            return self.exclude(event__geohash="")
+        cells = Q()
+        for cell in geo.neighbours(latitude, longitude, precision):
+            # Ranges use the index on every backend, unlike LIKE
+            cells |= Q(event__geohash__gte=cell, event__geohash__lt=cell + "~")
+        return self.filter(cells)
+
+    def nearby(self, latitude, longitude, radius, from_date=None, to_date=None, limit=None):
+        """
+        Listing tuples of the occurrences within a radius in km around a
+        point, sorted by start date and distance. Each tuple has its ``distance`` in km.
+        """
+        from_date = from_date or now()
+        candidates = load_listing(
+            self.near(latitude, longitude, radius).for_period(from_date, to_date)
+        )
+        occurrences = []
+        distances = {}
+        for occurrence in candidates:
+            event = occurrence.event
+            if event.pk not in distances:
+                distances[event.pk] = geo.distance(
+                    latitude, longitude, event.latitude, event.longitude
+                )
+            if distances[event.pk] <= radius:
+                occurrences.append(occurrence)
+        out = []
+        for occurrence_tuple in get_expander().expand_all(occurrences, from_date, to_date):
+            occurrence_tuple = OccurrenceTuple(occurrence_tuple)
+            occurrence_tuple.distance = distances[occurrence_tuple[2].event.pk]
+            out.append(occurrence_tuple)
+        out.sort(key=lambda t: (t[0], t.distance))
+        return out[:limit]
+
+
+class ArchivedOccurrenceQuerySet(OccurrenceQuerySet):
+    def for_period(self, from_date=None, to_date=None, exact=False):
+        """
+        Archived occurrences aren't indexed by month. They all ended, so
+        their start and end dates are enough to find those of a period.
+        """
+        return BaseOccurrenceQuerySet.for_period(self, from_date, to_date, exact)
 
-class OccurrenceManager(BaseOccurrenceManager):
+
+class PublishedOccurrenceMixin(object):
     def published(self):
         """
-        Return items with a published status and whose publish and expiry dates
-        fall before and after the current date when specified.
+        Return items from the current site with a published status and whose
+        publish and expiry dates fall before and after the current date when specified.
         """
         return self.filter(
+            Q(site_id=current_site_id()),
             Q(event__publish_date__lte=now()) | Q(event__publish_date__isnull=True),
             Q(event__expiry_date__gte=now()) | Q(event__expiry_date__isnull=True),
             Q(event__status=CONTENT_STATUS_PUBLISHED),
         )
 
+    def past(self):
+        """
+        Retrieve published events that ended in the past.
+        """
+        return self.published().for_period(to_date=now()).order_by("-start")
+
+
+class OccurrenceManager(
+    PublishedOccurrenceMixin, BaseOccurrenceManager.from_queryset(OccurrenceQuerySet)
+):
     def upcoming(self):
         """
         Retrieve published events that end today or in the future.
@@ -49,6 +188,13 @@ class OccurrenceManager(BaseOccurrenceManager):
 
     def past(self):
         """
-        Retrieve published events that ended in the past.
+        Retrieve published events that ended in the past. Only those of the
+        live table, the archived ones are in ``ArchivedOccurrence.objects.past()``.
         """
-        return self.published().for_period(to_date=now()).order_by("-start")
+        return super(OccurrenceManager, self).past()
+
+
+class ArchivedOccurrenceManager(
+    PublishedOccurrenceMixin, BaseOccurrenceManager.from_queryset(ArchivedOccurrenceQuerySet)
+):
+    pass
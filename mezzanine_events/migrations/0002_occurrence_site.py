@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 14:11
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_event_site(apps, schema_editor):
+    Event = apps.get_model("mezzanine_events", "Event")
+    Occurrence = apps.get_model("mezzanine_events", "Occurrence")
+    for site_id in Event.objects.values_list("site_id", flat=True).distinct():
+        events = Event.objects.filter(site_id=site_id)
+        Occurrence.objects.filter(event__in=events).update(site_id=site_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0002_alter_domain_unique'),
+        ('mezzanine_events', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='occurrence',
+            name='site',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='sites.Site'),
+        ),
+        migrations.RunPython(copy_event_site, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='occurrence',
+            name='site',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='sites.Site'),
+        ),
+        migrations.AddIndex(
+            model_name='occurrence',
+            index=models.Index(fields=['site', 'start'], name='mezzanine_e_site_id_ad7cb4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='occurrence',
+            index=models.Index(fields=['site', 'end'], name='mezzanine_e_site_id_57b329_idx'),
+        ),
+    ]
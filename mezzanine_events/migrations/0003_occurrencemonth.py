@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 14:18
+from __future__ import unicode_literals
+
+from datetime import date, datetime, time, timedelta
+
+from django.db import migrations, models
+from django.utils.timezone import utc
+import django.db.models.deletion
+
+
+def covered_months(occurrence):
+    """
+    Frozen copy of ``expansion.covered_months()``, months are in UTC.
+    """
+    start = occurrence.start.astimezone(utc)
+    end = occurrence.end.astimezone(utc) if occurrence.end else start
+    first = start.year * 12 + start.month - 1
+    span = end.year * 12 + end.month - 1 - first
+    every = 0
+
+    if not occurrence.repeat:
+        indexes = range(first, first + span + 1)
+    elif not occurrence.repeat_until:
+        if occurrence.repeat == "RRULE:FREQ=YEARLY":
+            indexes, every = range(first, first + span + 1), 12
+        else:
+            indexes, every = [first], 1
+    elif occurrence.repeat == "RRULE:FREQ=YEARLY":
+        indexes = set()
+        for year in range(start.year, occurrence.repeat_until.year + 1):
+            year_first = year * 12 + start.month - 1
+            indexes.update(range(year_first, year_first + span + 1))
+        indexes = sorted(indexes)
+    else:
+        last_day = datetime.combine(occurrence.repeat_until, time.max) + timedelta(days=1)
+        last_end = last_day + (end - start)
+        indexes = range(first, last_end.year * 12 + last_end.month)
+    return [date(i // 12, i % 12 + 1, 1) for i in indexes], every
+
+
+def build_months(apps, schema_editor):
+    Occurrence = apps.get_model("mezzanine_events", "Occurrence")
+    OccurrenceMonth = apps.get_model("mezzanine_events", "OccurrenceMonth")
+    for occurrence in Occurrence.objects.iterator():
+        months, every = covered_months(occurrence)
+        OccurrenceMonth.objects.bulk_create(
+            OccurrenceMonth(occurrence=occurrence, month=month, every=every) for month in months
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mezzanine_events', '0002_occurrence_site'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccurrenceMonth',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='First day of the month')),
+                ('every', models.PositiveSmallIntegerField(default=0, help_text='Zero when covered only once', verbose_name='Covered again every N months')),
+                ('occurrence', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='months', to='mezzanine_events.Occurrence')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='occurrencemonth',
+            index=models.Index(fields=['every', 'month', 'occurrence'], name='mezzanine_e_every_159a16_idx'),
+        ),
+        migrations.RunPython(build_months, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 14:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.utils.timezone import now
+
+from mezzanine_events.expansion import event_dates
+
+
+def fill_event_dates(apps, schema_editor):
+    # The expander needs the occurrence_data of the current model,
+    # the historical rows are copied into unsaved instances
+    from mezzanine_events.models import Occurrence as CurrentOccurrence
+
+    Event = apps.get_model("mezzanine_events", "Event")
+    when = now()
+    for event in Event.objects.prefetch_related("occurrences"):
+        occurrences = [
+            CurrentOccurrence(
+                start=o.start, end=o.end, repeat=o.repeat, repeat_until=o.repeat_until
+            )
+            for o in event.occurrences.all()
+        ]
+        next_start, last_end = event_dates(occurrences, when)
+        Event.objects.filter(pk=event.pk).update(next_start=next_start, last_end=last_end)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mezzanine_events', '0004_event_location_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='last_end',
+            field=models.DateTimeField(db_index=True, editable=False, null=True, verbose_name='Last end'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='next_start',
+            field=models.DateTimeField(db_index=True, editable=False, null=True, verbose_name='Next start'),
+        ),
+        migrations.RunPython(fill_event_dates, migrations.RunPython.noop),
+    ]
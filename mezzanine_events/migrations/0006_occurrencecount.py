@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 14:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import Counter
+
+from mezzanine.core.models import CONTENT_STATUS_PUBLISHED
+
+
+def count_occurrences(apps, schema_editor):
+    # The expander needs the occurrence_data of the current model,
+    # the historical rows are copied into unsaved instances
+    from mezzanine_events.archive import EventState, cell_counts
+    from mezzanine_events.models import Occurrence as CurrentOccurrence
+
+    Event = apps.get_model("mezzanine_events", "Event")
+    OccurrenceCount = apps.get_model("mezzanine_events", "OccurrenceCount")
+    counts = Counter()
+    for event in Event.objects.prefetch_related("occurrences", "categories"):
+        occurrences = [
+            CurrentOccurrence(
+                start=o.start, end=o.end, repeat=o.repeat, repeat_until=o.repeat_until
+            )
+            for o in event.occurrences.all()
+        ]
+        category_ids = tuple(sorted(c.pk for c in event.categories.all()))
+        published = event.status == CONTENT_STATUS_PUBLISHED
+        counts.update(cell_counts(occurrences, EventState(event.site_id, published, category_ids)))
+    OccurrenceCount.objects.bulk_create(
+        OccurrenceCount(site_id=site_id, year=year, month=month, category_id=category_id, count=n)
+        for (site_id, year, month, category_id), n in counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0002_alter_domain_unique'),
+        ('mezzanine_events', '0005_event_dates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccurrenceCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Year')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='Month')),
+                ('count', models.IntegerField(default=0, verbose_name='Count')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mezzanine_events.EventCategory')),
+                ('site', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='sites.Site')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='occurrencecount',
+            unique_together=set([('site', 'category', 'year', 'month')]),
+        ),
+        migrations.RunPython(count_occurrences, migrations.RunPython.noop),
+    ]
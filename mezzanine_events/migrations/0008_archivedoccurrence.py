@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 15:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import eventtools.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0002_alter_domain_unique'),
+        ('mezzanine_events', '0007_event_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOccurrence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(db_index=True)),
+                ('end', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('repeat', eventtools.models.ChoiceTextField(blank=True, choices=[(b'RRULE:FREQ=DAILY', b'Daily'), (b'RRULE:FREQ=WEEKLY', b'Weekly'), (b'RRULE:FREQ=MONTHLY', b'Monthly'), (b'RRULE:FREQ=YEARLY', b'Yearly')], default=b'')),
+                ('repeat_until', models.DateField(blank=True, null=True)),
+                ('original_id', models.IntegerField(unique=True, verbose_name='Original ID')),
+                ('archived', models.DateTimeField(auto_now_add=True, verbose_name='Archived')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_occurrences', to='mezzanine_events.Event')),
+                ('site', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='sites.Site')),
+            ],
+            options={
+                'ordering': ('start', 'end'),
+                'abstract': False,
+            },
+            bases=(models.Model, eventtools.models.OccurrenceMixin),
+        ),
+        migrations.AddIndex(
+            model_name='archivedoccurrence',
+            index=models.Index(fields=['site', 'start'], name='mezzanine_e_site_id_73f2eb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedoccurrence',
+            index=models.Index(fields=['site', 'end'], name='mezzanine_e_site_id_908832_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 15:07
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mezzanine_events', '0008_archivedoccurrence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventRecommendation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Rank')),
+                ('score', models.FloatField(verbose_name='Score')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='mezzanine_events.Event')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_for', to='mezzanine_events.Event')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecommendationSource',
+            fields=[
+                ('event_id', models.IntegerField(primary_key=True, serialize=False, verbose_name='Event ID')),
+                ('fingerprint', models.CharField(max_length=40, verbose_name='Fingerprint')),
+                ('count', models.PositiveSmallIntegerField(verbose_name='Recommendations')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='eventrecommendation',
+            unique_together=set([('event', 'rank')]),
+        ),
+    ]
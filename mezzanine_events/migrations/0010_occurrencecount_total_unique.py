@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from collections import Counter
+
+from mezzanine.core.models import CONTENT_STATUS_PUBLISHED
+
+# Rows without a category aren't covered by unique_together, NULLs are all
+# different. Only some backends support partial indexes.
+TOTAL_INDEX = "mezzanine_events_occurrencecount_total"
+PARTIAL_INDEX_VENDORS = ("postgresql", "sqlite")
+
+
+def recount_occurrences(apps, schema_editor):
+    # Open-ended repetitions used to be counted up to a date that moves,
+    # count again with the fixed horizon. Also merges duplicated totals.
+    from mezzanine_events.archive import EventState, cell_counts
+    from mezzanine_events.models import Occurrence as CurrentOccurrence
+
+    Event = apps.get_model("mezzanine_events", "Event")
+    OccurrenceCount = apps.get_model("mezzanine_events", "OccurrenceCount")
+    counts = Counter()
+    events = Event.objects.prefetch_related("occurrences", "archived_occurrences", "categories")
+    for event in events:
+        occurrences = [
+            CurrentOccurrence(
+                start=o.start, end=o.end, repeat=o.repeat, repeat_until=o.repeat_until
+            )
+            for o in list(event.occurrences.all()) + list(event.archived_occurrences.all())
+        ]
+        category_ids = tuple(sorted(c.pk for c in event.categories.all()))
+        published = event.status == CONTENT_STATUS_PUBLISHED
+        counts.update(cell_counts(occurrences, EventState(event.site_id, published, category_ids)))
+    OccurrenceCount.objects.all().delete()
+    OccurrenceCount.objects.bulk_create(
+        OccurrenceCount(site_id=site_id, year=year, month=month, category_id=category_id, count=n)
+        for (site_id, year, month, category_id), n in counts.items()
+        if n
+    )
+
+
+def create_total_index(apps, schema_editor):
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        schema_editor.execute(
+            "CREATE UNIQUE INDEX %s ON mezzanine_events_occurrencecount "
+            "(site_id, year, month) WHERE category_id IS NULL" % TOTAL_INDEX
+        )
+
+
+def drop_total_index(apps, schema_editor):
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        schema_editor.execute("DROP INDEX %s" % TOTAL_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mezzanine_events', '0009_eventrecommendation'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_occurrences, migrations.RunPython.noop),
+        migrations.RunPython(create_total_index, drop_total_index),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 16:07
+from __future__ import unicode_literals
+
+from importlib import import_module
+
+from django.db import migrations
+
+
+def rebuild_months(apps, schema_editor):
+    # The months used to be in the timezone active when the occurrence was
+    # saved, build them again in UTC
+    OccurrenceMonth = apps.get_model("mezzanine_events", "OccurrenceMonth")
+    OccurrenceMonth.objects.all().delete()
+    import_module("mezzanine_events.migrations.0003_occurrencemonth").build_months(
+        apps, schema_editor
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mezzanine_events', '0010_occurrencecount_total_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_months, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 16:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Q
+from django.utils.timezone import now
+from collections import Counter
+
+from mezzanine.core.models import CONTENT_STATUS_PUBLISHED
+
+
+def recount_occurrences(apps, schema_editor):
+    # Events used to be counted by their status alone, count only those
+    # that are published now, ignoring the ones not yet published or expired
+    from mezzanine_events.archive import EventState, cell_counts
+    from mezzanine_events.models import Occurrence as CurrentOccurrence
+
+    Event = apps.get_model("mezzanine_events", "Event")
+    OccurrenceCount = apps.get_model("mezzanine_events", "OccurrenceCount")
+    when = now()
+    published = Event.objects.filter(
+        Q(publish_date__lte=when) | Q(publish_date__isnull=True),
+        Q(expiry_date__gte=when) | Q(expiry_date__isnull=True),
+        status=CONTENT_STATUS_PUBLISHED,
+    )
+    published.update(counted=True)
+    counts = Counter()
+    events = published.prefetch_related("occurrences", "archived_occurrences", "categories")
+    for event in events:
+        occurrences = [
+            CurrentOccurrence(
+                start=o.start, end=o.end, repeat=o.repeat, repeat_until=o.repeat_until
+            )
+            for o in list(event.occurrences.all()) + list(event.archived_occurrences.all())
+        ]
+        category_ids = tuple(sorted(c.pk for c in event.categories.all()))
+        counts.update(cell_counts(occurrences, EventState(event.site_id, True, category_ids)))
+    OccurrenceCount.objects.all().delete()
+    OccurrenceCount.objects.bulk_create(
+        OccurrenceCount(site_id=site_id, year=year, month=month, category_id=category_id, count=n)
+        for (site_id, year, month, category_id), n in counts.items()
+        if n
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mezzanine_events', '0011_occurrencemonth_utc'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='counted',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Counted'),
+        ),
+        migrations.RunPython(recount_occurrences, migrations.RunPython.noop),
+    ]
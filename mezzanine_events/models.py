@@ -1,19 +1,27 @@
 from __future__ import unicode_literals, absolute_import
 
-from eventtools.models import BaseEvent, BaseOccurrence
+from operator import attrgetter
+
+from eventtools.models import REPEAT_MAX, BaseEvent, BaseOccurrence
 
 from django.core.urlresolvers import reverse
 from django.db import models
 from django.template.defaultfilters import date, urlencode
 from django.utils.encoding import python_2_unicode_compatible
+from django.utils.timezone import now
 
 from mezzanine.core.fields import FileField
 from mezzanine.core.models import Displayable, Ownable, RichText, Slugged
 from mezzanine.utils.models import AdminThumbMixin
 
-from .managers import EventManager, OccurrenceManager
+from .expansion import covered_months, event_dates, get_expander
+from .geo import encode, geocode
+from .managers import ArchivedOccurrenceManager, EventManager, OccurrenceManager
 from .utils import duration_info
 
+# Fields that decide the coordinates of an event
+PLACE_FIELDS = ("address", "location", "latitude", "longitude")
+
 
 class Event(BaseEvent, Displayable, Ownable, RichText, AdminThumbMixin):
     """
@@ -23,7 +31,7 @@ class Event(BaseEvent, Displayable, Ownable, RichText, AdminThumbMixin):
     categories = models.ManyToManyField(
         "EventCategory", verbose_name="Categories", blank=True, related_name="events"
     )
-    location = models.CharField("Location", max_length=200, blank=True)
+    location = models.CharField("Location", max_length=200, blank=True, db_index=True)
     address = models.TextField("Address", blank=True)
     link = models.URLField("External link", blank=True, help_text="Link to purchase tickets")
     featured = models.BooleanField("Featured", default=False)
@@ -31,6 +39,17 @@ class Event(BaseEvent, Displayable, Ownable, RichText, AdminThumbMixin):
         "Featured Image", upload_to="events", format="Image", max_length=255, blank=True
     )
     related_events = models.ManyToManyField("self", verbose_name="Related events", blank=True)
+    latitude = models.FloatField(
+        "Latitude", null=True, blank=True, help_text="Looked up from the address when empty"
+    )
+    longitude = models.FloatField("Longitude", null=True, blank=True)
+    # Maintained from the coordinates, see geo.py
+    geohash = models.CharField("Geohash", max_length=12, blank=True, editable=False, db_index=True)
+    # Maintained from the occurrences, see update_dates()
+    next_start = models.DateTimeField("Next start", null=True, editable=False, db_index=True)
+    last_end = models.DateTimeField("Last end", null=True, editable=False, db_index=True)
+    # Whether the occurrences are in the archive counts, see archive.py
+    counted = models.BooleanField("Counted", default=False, editable=False)
 
     search_fields = {"title": 10, "keywords": 10, "content": 5}
     admin_thumb_field = "featured_image"
@@ -41,12 +60,84 @@ class Event(BaseEvent, Displayable, Ownable, RichText, AdminThumbMixin):
         verbose_name_plural = "events"
         ordering = ("-featured",)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Event, cls).from_db(db, field_names, values)
+        instance.remember_place()
+        return instance
+
+    def remember_place(self):
+        """
+        Keep the address, location and coordinates as they are in the database.
+        """
+        loaded = self.get_deferred_fields()
+        if not loaded.intersection(PLACE_FIELDS):
+            self._place = dict((name, getattr(self, name)) for name in PLACE_FIELDS)
+
+    def geocoded_place_changed(self):
+        """
+        Whether the address or location changed since the event was loaded,
+        while the coordinates are still the ones geocoded from the previous
+        one. Coordinates entered by hand are kept.
+        """
+        place = getattr(self, "_place", None)
+        if place is None:
+            return False
+        previous_query = place["address"] or place["location"]
+        if (self.address or self.location) == previous_query:
+            return False
+        coordinates = (self.latitude, self.longitude)
+        if coordinates != (place["latitude"], place["longitude"]):
+            return False
+        return coordinates == geocode(previous_query)
+
+    def save(self, *args, **kwargs):
+        """
+        Fill the coordinates and keep the denormalized site of the occurrences in sync.
+        """
+        if self.latitude is None or self.longitude is None or self.geocoded_place_changed():
+            coordinates = geocode(self.address or self.location)
+            self.latitude, self.longitude = coordinates or (None, None)
+        self.geohash = ""
+        if self.latitude is not None:
+            self.geohash = encode(self.latitude, self.longitude)
+        super(Event, self).save(*args, **kwargs)
+        self.remember_place()
+        self.occurrences.exclude(site_id=self.site_id).update(site_id=self.site_id)
+
     def get_absolute_url(self):
         return reverse("mezzanine_events:event_detail", args=[self.slug])
 
     def directions_url(self):
+        if self.latitude is not None:
+            return "https://maps.google.com/maps?daddr={},{}".format(self.latitude, self.longitude)
         return "https://maps.google.com/maps?daddr=" + urlencode(self.location)
 
+    def update_dates(self, when=None):
+        """
+        Recompute ``next_start`` and ``last_end`` from the occurrences.
+        The row is updated directly so no save signals are sent.
+        """
+        # Archived occurrences ended long ago, but one of them can be the last
+        occurrences = list(self.occurrences.all()) + list(self.archived_occurrences.all())
+        self.next_start, self.last_end = event_dates(occurrences, when or now())
+        type(self)._base_manager.filter(pk=self.pk).update(
+            next_start=self.next_start, last_end=self.last_end
+        )
+
+    def stored_occurrences(self):
+        """
+        The live occurrences of the event and the archived ones, as unsaved
+        ``Occurrence`` instances with their original primary keys. Sorted like
+        the occurrences, ``occurrences`` alone only has the live ones.
+        """
+        occurrences = list(self.occurrences.all())
+        for archived in self.archived_occurrences.all():
+            occurrence = archived.as_occurrence()
+            occurrence.event = self
+            occurrences.append(occurrence)
+        return sorted(occurrences, key=attrgetter("start"))
+
     def duplicate(self):
         """
         Create a copy of an existing Event instance.
@@ -61,8 +152,8 @@ class Event(BaseEvent, Displayable, Ownable, RichText, AdminThumbMixin):
         # Add the same categories
         dup.categories.add(*self.categories.all())
 
-        # Duplicate EventDateTime instances
-        for dt in self.occurrences.all():
+        # Duplicate EventDateTime instances, the archived ones become live
+        for dt in self.stored_occurrences():
             dt.pk = None
             dt.event = dup
             dt.save()
@@ -79,12 +170,32 @@ class Occurrence(BaseOccurrence):
     """
 
     event = models.ForeignKey(Event, related_name="occurrences")
+    # Copied from the event so site-scoped queries don't need a join
+    site = models.ForeignKey("sites.Site", editable=False)
 
     objects = OccurrenceManager()
 
+    class Meta(BaseOccurrence.Meta):
+        indexes = [models.Index(fields=["site", "start"]), models.Index(fields=["site", "end"])]
+
     def __str__(self):
         return duration_info(self.start, self.end)
 
+    def save(self, *args, **kwargs):
+        """
+        Inherit the site from the event.
+        """
+        self.site_id = self.event.site_id
+        super(Occurrence, self).save(*args, **kwargs)
+        self.months.all().delete()
+        OccurrenceMonth.objects.bulk_create(OccurrenceMonth.for_occurrence(self))
+
+    def all_occurrences(self, from_date=None, to_date=None, limit=REPEAT_MAX):
+        """
+        Generate (start, end, occurrence) tuples with the configured expander.
+        """
+        return get_expander().expand(self, from_date, to_date, limit)
+
     def repetition_info(self):
         if not self.repeat:
             return ""
@@ -94,6 +205,125 @@ class Occurrence(BaseOccurrence):
         return out
 
 
+@python_2_unicode_compatible
+class ArchivedOccurrence(BaseOccurrence):
+    """
+    An occurrence moved out of ``Occurrence`` once it ended, see
+    ``partition.archive_occurrences()``. Keeps the original primary key so
+    it can be restored.
+    """
+
+    event = models.ForeignKey(Event, related_name="archived_occurrences")
+    site = models.ForeignKey("sites.Site", editable=False)
+    original_id = models.IntegerField("Original ID", unique=True)
+    archived = models.DateTimeField("Archived", auto_now_add=True)
+
+    objects = ArchivedOccurrenceManager()
+
+    class Meta(BaseOccurrence.Meta):
+        indexes = [models.Index(fields=["site", "start"]), models.Index(fields=["site", "end"])]
+
+    def __str__(self):
+        return duration_info(self.start, self.end)
+
+    def as_occurrence(self):
+        """
+        An unsaved ``Occurrence`` like the one this was archived from.
+        """
+        return Occurrence(
+            pk=self.original_id,
+            event_id=self.event_id,
+            site_id=self.site_id,
+            start=self.start,
+            end=self.end,
+            repeat=self.repeat,
+            repeat_until=self.repeat_until,
+        )
+
+
+class OccurrenceMonth(models.Model):
+    """
+    Month covered by the repetitions of an occurrence. Allows finding the
+    occurrences of a period without considering every repeating occurrence
+    that started before it.
+
+    Built by ``Occurrence.save()``. Code that creates occurrences or changes
+    their dates without calling it, like ``bulk_create()`` or ``update()``,
+    must replace their rows with ``for_occurrence()``.
+    """
+
+    occurrence = models.ForeignKey(Occurrence, related_name="months")
+    month = models.DateField("First day of the month")
+    every = models.PositiveSmallIntegerField(
+        "Covered again every N months", default=0, help_text="Zero when covered only once"
+    )
+
+    class Meta:
+        indexes = [models.Index(fields=["every", "month", "occurrence"])]
+
+    @classmethod
+    def for_occurrence(cls, occurrence):
+        """
+        Unsaved instances for all the months covered by an occurrence.
+        """
+        months, every = covered_months(occurrence)
+        return [cls(occurrence=occurrence, month=month, every=every) for month in months]
+
+
+class OccurrenceCount(models.Model):
+    """
+    Number of repetitions of the occurrences of published events that start
+    in a month, per site and category. Rows without a category hold the
+    total of all events. Kept up to date by the ``archive`` module.
+    """
+
+    site = models.ForeignKey("sites.Site", editable=False)
+    year = models.PositiveSmallIntegerField("Year")
+    month = models.PositiveSmallIntegerField("Month")
+    category = models.ForeignKey("EventCategory", null=True, related_name="+")
+    count = models.IntegerField("Count", default=0)
+
+    class Meta:
+        unique_together = [("site", "category", "year", "month")]
+
+
+class GeocodeCache(models.Model):
+    """
+    Coordinates the geocoder found for an address, null when it found none.
+    """
+
+    query = models.CharField("Address", max_length=255, unique=True)
+    latitude = models.FloatField("Latitude", null=True)
+    longitude = models.FloatField("Longitude", null=True)
+    created = models.DateTimeField("Created", auto_now_add=True)
+
+
+class EventRecommendation(models.Model):
+    """
+    An upcoming event similar to another one, ranked from 1 for the most
+    similar. Computed by ``recommendations.update_recommendations()``.
+    """
+
+    event = models.ForeignKey(Event, related_name="recommendations")
+    recommended = models.ForeignKey(Event, related_name="recommended_for")
+    rank = models.PositiveSmallIntegerField("Rank")
+    score = models.FloatField("Score")
+
+    class Meta:
+        unique_together = [("event", "rank")]
+
+
+class RecommendationSource(models.Model):
+    """
+    Hash of what the recommendations of an event were computed from, and
+    how many there were, to tell which ones need to be computed again.
+    """
+
+    event_id = models.IntegerField("Event ID", primary_key=True)
+    fingerprint = models.CharField("Fingerprint", max_length=40)
+    count = models.PositiveSmallIntegerField("Recommendations")
+
+
 class EventCategory(Slugged):
     """
     A category for grouping events into a series.
@@ -0,0 +1,125 @@
+"""
+Hot/cold partitioning of occurrences. Occurrences that ended more than
+``EVENTS_ARCHIVE_DAYS`` ago are moved to ``ArchivedOccurrence``, so the
+live table that serves the upcoming calendar only holds what's current.
+Listings of periods that reach that far back read both tables, and so do
+``Event.stored_occurrences()`` and the detail, ICS and JSON views of an
+event. ``Event.occurrences`` and ``Occurrence.objects`` only have the live ones.
+
+The monthly counts and the dates of the events include the archived
+occurrences, moving them doesn't change either.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from datetime import timedelta
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import localtime, now
+
+from eventtools.models import as_datetime
+
+from mezzanine.conf import settings
+
+from . import signals
+from .caching import invalidate
+from .expansion import event_dates
+from .models import ArchivedOccurrence, Occurrence, OccurrenceMonth
+
+FIELDS = ("event_id", "site_id", "start", "end", "repeat", "repeat_until")
+
+
+def archive_cutoff(when=None):
+    """
+    Occurrences that ended before this date belong in the archive.
+    """
+    return (when or now()) - timedelta(days=settings.EVENTS_ARCHIVE_DAYS)
+
+
+def has_ended(occurrence, cutoff):
+    """
+    Whether the last repetition of an occurrence ended before ``cutoff``.
+    """
+    last_end = event_dates([occurrence], cutoff)[1]
+    return last_end is not None and last_end < cutoff
+
+
+def archive_occurrences(cutoff=None, batch_size=500):
+    """
+    Move the occurrences that ended before ``cutoff`` to the archive, in
+    transactions of ``batch_size`` occurrences. Returns the number moved.
+    """
+    cutoff = cutoff or archive_cutoff()
+    once = Q(repeat="") & (Q(end__lt=cutoff) | Q(end__isnull=True, start__lt=cutoff))
+    repeating = ~Q(repeat="") & Q(repeat_until__lt=localtime(cutoff).date())
+    candidates = Occurrence.objects.filter(once | repeating).order_by("pk")
+
+    moved = last_pk = 0
+    while True:
+        batch = list(candidates.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return moved
+        last_pk = batch[-1].pk
+        batch = [occurrence for occurrence in batch if has_ended(occurrence, cutoff)]
+        pks = [occurrence.pk for occurrence in batch]
+        with transaction.atomic(), signals.paused():
+            ArchivedOccurrence.objects.bulk_create(
+                ArchivedOccurrence(
+                    original_id=occurrence.pk,
+                    **dict((field, getattr(occurrence, field)) for field in FIELDS)
+                )
+                for occurrence in batch
+            )
+            OccurrenceMonth.objects.filter(occurrence_id__in=pks).delete()
+            Occurrence.objects.filter(pk__in=pks).delete()
+        for site_id in set(occurrence.site_id for occurrence in batch):
+            invalidate(site_id)
+        moved += len(batch)
+
+
+def restore_occurrences(batch_size=500):
+    """
+    Move all the archived occurrences back to the live table, with their
+    original primary keys. Returns the number restored.
+    """
+    restored = 0
+    while True:
+        batch = list(ArchivedOccurrence.objects.order_by("pk")[:batch_size])
+        if not batch:
+            return restored
+        occurrences = [archived.as_occurrence() for archived in batch]
+        with transaction.atomic():
+            Occurrence.objects.bulk_create(occurrences)
+            OccurrenceMonth.objects.bulk_create(
+                month
+                for occurrence in occurrences
+                for month in OccurrenceMonth.for_occurrence(occurrence)
+            )
+            ArchivedOccurrence.objects.filter(pk__in=[archived.pk for archived in batch]).delete()
+        for site_id in set(archived.site_id for archived in batch):
+            invalidate(site_id)
+        restored += len(batch)
+
+
+def published_occurrences(from_date=None):
+    """
+    Querysets of the published occurrences that a period starting at
+    ``from_date`` can include: the live ones, and the archived ones when
+    the period reaches them.
+    """
+    querysets = [Occurrence.objects.published()]
+    if from_date is None or as_datetime(from_date) < archive_cutoff():
+        querysets.append(ArchivedOccurrence.objects.published())
+    return querysets
+
+
+def listing(querysets, from_date=None, to_date=None):
+    """
+    Listing tuples of some querysets of occurrences, sorted by start date.
+    """
+    out = []
+    for qs in querysets:
+        out.extend(qs.listing(from_date, to_date))
+    out.sort(key=itemgetter(0))
+    return out
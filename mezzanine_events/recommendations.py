@@ -0,0 +1,294 @@
+"""
+Precomputed recommendations of similar upcoming events, stored in
+``EventRecommendation`` and refreshed by ``update_event_recommendations``.
+
+Events are compared with a score that adds up the cosine similarity of
+their TF-IDF vectors, built from ``Event.search_fields``, the overlap of
+their categories and how close their dates are. Only the upcoming events
+that share a term or a category with an event are scored, found through
+inverted indexes of their sparse vectors.
+
+Each run hashes what the scores depend on and only recomputes what changed:
+
+* The recommendations of the changed events.
+* Those of events that recommended a changed or removed event.
+* Everyone else only gets the changed events scored against them, merged
+  into their current recommendations.
+
+The scores of unchanged pairs are kept as they were, although the weights
+of the terms drift as events come and go. Run a full update from time to
+time to refresh them.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import hashlib
+import heapq
+import json
+import re
+
+from collections import Counter, defaultdict, namedtuple
+from datetime import datetime
+from itertools import groupby
+from math import exp, log, sqrt
+from operator import attrgetter, itemgetter
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils.html import strip_tags
+from django.utils.timezone import now, utc
+
+from mezzanine.conf import settings
+from mezzanine.core.models import CONTENT_STATUS_PUBLISHED
+
+from .models import Event, EventRecommendation, RecommendationSource
+
+TEXT_WEIGHT = 0.6
+CATEGORY_WEIGHT = 0.3
+DATE_WEIGHT = 0.1
+# Days apart for the date proximity to drop to 1/e
+DATE_SCALE = 30.0
+EPOCH = datetime(1970, 1, 1, tzinfo=utc)
+
+# Terms of an event looked up in the index, the ones with the highest weights
+QUERY_TERMS = 20
+
+# Model fields of the text in search_fields, when their names differ
+TEXT_FIELDS = {"keywords": "keywords_string"}
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+STOP_WORDS = frozenset(
+    """
+    about after all also and any are been before but can come for from has have her his
+    how into its more not now one only our out over she than that the their them then
+    there these they this through was were what when where which who will with you your
+    """.split()
+)
+
+# What an event is compared on, ``terms`` are weighted term frequencies
+Document = namedtuple("Document", "pk site_id terms category_ids date upcoming")
+
+
+def tokenize(text):
+    words = WORD_RE.findall(strip_tags(text).lower())
+    return [w for w in words if len(w) > 2 and not w.isdigit() and w not in STOP_WORDS]
+
+
+def load_documents():
+    """
+    ``Document`` of every published event of every site.
+    """
+    current_time = now()
+    published = Event._base_manager.filter(
+        Q(publish_date__lte=current_time) | Q(publish_date__isnull=True),
+        Q(expiry_date__gte=current_time) | Q(expiry_date__isnull=True),
+        status=CONTENT_STATUS_PUBLISHED,
+    )
+    fields = dict((name, TEXT_FIELDS.get(name, name)) for name in Event.search_fields)
+    rows = published.values("pk", "site_id", "next_start", "last_end", *fields.values())
+
+    categories = defaultdict(set)
+    Categories = Event.categories.through
+    for event_id, category_id in Categories.objects.values_list("event_id", "eventcategory_id"):
+        categories[event_id].add(category_id)
+
+    documents = []
+    for row in rows.iterator():
+        terms = Counter()
+        for name, weight in Event.search_fields.items():
+            for word in tokenize(row[fields[name]] or ""):
+                terms[word] += weight
+        last_end = row["last_end"]
+        upcoming = last_end >= current_time if last_end else row["next_start"] is not None
+        documents.append(
+            Document(
+                row["pk"],
+                row["site_id"],
+                terms,
+                frozenset(categories[row["pk"]]),
+                row["next_start"] or last_end,
+                upcoming,
+            )
+        )
+    return documents
+
+
+def fingerprint(document, limit):
+    """
+    Hash of everything the recommendations of an event depend on.
+    """
+    data = [
+        limit,
+        document.site_id,
+        sorted(document.terms.items()),
+        sorted(document.category_ids),
+        document.date and document.date.isoformat(),
+        document.upcoming,
+    ]
+    return hashlib.sha1(json.dumps(data).encode("utf-8")).hexdigest()
+
+
+def tfidf_vectors(documents):
+    """
+    Sparse TF-IDF vectors of some documents with a unit length, as dicts of terms to weights.
+    """
+    frequencies = Counter()
+    for document in documents:
+        frequencies.update(document.terms.keys())
+    count = len(documents)
+    vectors = {}
+    for document in documents:
+        vector = {}
+        for term, tf in document.terms.items():
+            # Terms found in every document have no weight
+            weight = (1 + log(tf)) * log(count / frequencies[term])
+            if weight > 0:
+                vector[term] = weight
+        norm = sqrt(sum(weight * weight for weight in vector.values()))
+        vectors[document.pk] = dict((term, weight / norm) for term, weight in vector.items())
+    return vectors
+
+
+def days(value):
+    """
+    A datetime as a number of days, for date proximities.
+    """
+    if value is None:
+        return None
+    return (value - EPOCH).total_seconds() / 86400
+
+
+class CandidateIndex(object):
+    """
+    Inverted indexes of the terms and categories of the events that can be recommended.
+    """
+
+    def __init__(self, documents, vectors):
+        self.terms = defaultdict(list)
+        self.categories = defaultdict(list)
+        self.category_counts = {}
+        self.days = {}
+        for document in documents:
+            for term, weight in vectors[document.pk].items():
+                self.terms[term].append((document.pk, TEXT_WEIGHT * weight))
+            for category_id in document.category_ids:
+                self.categories[category_id].append(document.pk)
+            self.category_counts[document.pk] = len(document.category_ids)
+            self.days[document.pk] = days(document.date)
+
+    def __len__(self):
+        return len(self.days)
+
+    def scores(self, document, vector):
+        """
+        Scores of the candidates that share a category or one of its main terms
+        with a document. The rest of its terms add little to the similarity.
+        """
+        out = defaultdict(float)
+        for term, weight in heapq.nlargest(QUERY_TERMS, vector.items(), key=itemgetter(1)):
+            for pk, candidate_weight in self.terms.get(term, ()):
+                out[pk] += weight * candidate_weight
+        shared = Counter()
+        for category_id in document.category_ids:
+            shared.update(self.categories.get(category_id, ()))
+        for pk, count in shared.items():
+            union = len(document.category_ids) + self.category_counts[pk] - count
+            out[pk] += CATEGORY_WEIGHT * count / union
+
+        out.pop(document.pk, None)
+        document_days = days(document.date)
+        if document_days is not None:
+            for pk in out:
+                candidate_days = self.days[pk]
+                if candidate_days is not None:
+                    distance = abs(document_days - candidate_days)
+                    out[pk] += DATE_WEIGHT * exp(-distance / DATE_SCALE)
+        return out
+
+
+def top(scores, limit):
+    """
+    The ``limit`` best (pk, score) pairs, the oldest event first among equal scores.
+    """
+    return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+def chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        end = start + size
+        yield items[start:end]
+
+
+def update_recommendations(full=False, limit=None, batch_size=500):
+    """
+    Recompute the recommendations of the events that need it, all of them
+    when ``full`` is set. Returns the number of events whose recommendations changed.
+    """
+    limit = limit or settings.EVENTS_RECOMMENDATION_COUNT
+    documents = load_documents()
+    fingerprints = dict((document.pk, fingerprint(document, limit)) for document in documents)
+    sources = dict(
+        (event_id, (value, count))
+        for event_id, value, count in RecommendationSource.objects.values_list(
+            "event_id", "fingerprint", "count"
+        )
+    )
+    changed = set(
+        pk for pk, value in fingerprints.items() if full or sources.get(pk, (None,))[0] != value
+    )
+    stale = changed | (set(sources) - set(fingerprints))
+
+    current = defaultdict(list)
+    rows = EventRecommendation.objects.order_by("event_id", "rank")
+    for event_id, recommended_id, score in rows.values_list("event_id", "recommended_id", "score"):
+        current[event_id].append((recommended_id, score))
+    # Losing a recommendation leaves a place that any candidate can take. Those
+    # of deleted events are gone with them, but the count tells they existed.
+    recompute = changed | set(
+        pk
+        for pk, (value, count) in sources.items()
+        if len(current[pk]) < count or any(other in stale for other, score in current[pk])
+    )
+
+    results = {}
+    documents.sort(key=attrgetter("site_id"))
+    for site_id, site_documents in groupby(documents, attrgetter("site_id")):
+        site_documents = list(site_documents)
+        if not any(document.pk in recompute for document in site_documents):
+            continue
+        candidates = [document for document in site_documents if document.upcoming]
+        vectors = tfidf_vectors(site_documents)
+        index = CandidateIndex(candidates, vectors)
+        changed_index = CandidateIndex([c for c in candidates if c.pk in changed], vectors)
+        for document in site_documents:
+            if document.pk in recompute:
+                results[document.pk] = top(index.scores(document, vectors[document.pk]), limit)
+            elif changed_index:
+                scores = dict(current[document.pk])
+                scores.update(changed_index.scores(document, vectors[document.pk]))
+                results[document.pk] = top(scores, limit)
+    results = dict((pk, pairs) for pk, pairs in results.items() if pairs != current[pk])
+
+    # The sources go last, an interrupted run is picked up by the next one
+    removed = set(current) - set(fingerprints)
+    for pks in chunks(removed | set(results), batch_size):
+        with transaction.atomic():
+            EventRecommendation.objects.filter(event_id__in=pks).delete()
+            EventRecommendation.objects.bulk_create(
+                EventRecommendation(event_id=pk, recommended_id=other, rank=rank, score=score)
+                for pk in pks
+                for rank, (other, score) in enumerate(results.get(pk, ()), 1)
+            )
+    for pks in chunks(stale | set(results), batch_size):
+        with transaction.atomic():
+            RecommendationSource.objects.filter(event_id__in=pks).delete()
+            RecommendationSource.objects.bulk_create(
+                RecommendationSource(
+                    event_id=pk,
+                    fingerprint=fingerprints[pk],
+                    count=len(results.get(pk, current[pk])),
+                )
+                for pk in pks
+                if pk in fingerprints
+            )
+    return len(results) + len(removed)
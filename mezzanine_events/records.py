@@ -0,0 +1,113 @@
+"""
+Compact stand-ins for Event and Occurrence, used when listing many occurrences.
+They only carry the columns that listings need, and every occurrence of an
+event shares the same event record.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from django.core.urlresolvers import reverse
+from django.template.defaultfilters import date, urlencode
+from django.utils.encoding import python_2_unicode_compatible
+
+from eventtools.models import REPEAT_CHOICES
+
+from mezzanine.conf import settings
+
+from .utils import duration_info
+
+EVENT_COLUMNS = (
+    "id",
+    "site_id",
+    "title",
+    "slug",
+    "description",
+    "location",
+    "link",
+    "featured",
+    "featured_image",
+    "latitude",
+    "longitude",
+)
+OCCURRENCE_COLUMNS = ("id", "event_id", "start", "end", "repeat", "repeat_until")
+
+
+@python_2_unicode_compatible
+class EventRecord(object):
+    __slots__ = EVENT_COLUMNS
+
+    def __init__(self, *values):
+        for field, value in zip(EVENT_COLUMNS, values):
+            setattr(self, field, value)
+
+    def __str__(self):
+        return self.title
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_absolute_url(self):
+        return reverse("mezzanine_events:event_detail", args=[self.slug])
+
+    def directions_url(self):
+        if self.latitude is not None:
+            return "https://maps.google.com/maps?daddr={},{}".format(self.latitude, self.longitude)
+        return "https://maps.google.com/maps?daddr=" + urlencode(self.location)
+
+
+@python_2_unicode_compatible
+class OccurrenceRecord(object):
+    __slots__ = OCCURRENCE_COLUMNS + ("event",)
+
+    def __init__(self, event, *values):
+        self.event = event
+        for field, value in zip(OCCURRENCE_COLUMNS, values):
+            setattr(self, field, value)
+
+    def __str__(self):
+        return duration_info(self.start, self.end)
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def occurrence_data(self):
+        return self
+
+    def get_repeat_display(self):
+        return dict(REPEAT_CHOICES).get(self.repeat, self.repeat)
+
+    def repetition_info(self):
+        if not self.repeat:
+            return ""
+        out = "Repeats {}".format(self.get_repeat_display().lower())
+        if self.repeat_until:
+            out += " until {}".format(date(self.repeat_until))
+        return out
+
+
+def load_records(qs):
+    """
+    Occurrence records for a queryset of occurrences, in a single query.
+    """
+    columns = OCCURRENCE_COLUMNS + tuple("event__" + f for f in EVENT_COLUMNS)
+    split = len(OCCURRENCE_COLUMNS)
+    events = {}
+    out = []
+    for row in qs.values_list(*columns):
+        event = events.get(row[1])
+        if event is None:
+            event = events[row[1]] = EventRecord(*row[split:])
+        out.append(OccurrenceRecord(event, *row[:split]))
+    return out
+
+
+def load_listing(qs):
+    """
+    What listings display of a queryset of occurrences: records when
+    ``EVENTS_LISTING_RECORDS`` is enabled, model instances along with their event otherwise.
+    """
+    if settings.EVENTS_LISTING_RECORDS:
+        return load_records(qs)
+    return qs.select_related("event")
@@ -0,0 +1,110 @@
+"""
+Routing of the calendar's read-only pages to a read replica.
+
+The views and template tags that only read run their queries against the
+database alias in ``EVENTS_READ_DATABASE``, through ``ReplicaRouter`` which
+must be listed in ``DATABASE_ROUTERS``. Everything else, including writes and
+the admin, uses the default database.
+
+The replica lags behind the default database. Staff who saved an event in the
+admin read from the default database for ``EVENTS_READ_DATABASE_LAG`` seconds
+afterwards, so they see their changes right away.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import threading
+
+from contextlib import contextmanager
+from functools import wraps
+from time import time
+
+from django.conf import settings as django_settings
+from django.db import DEFAULT_DB_ALIAS
+
+from mezzanine.conf import settings
+
+SESSION_KEY = "mezzanine_events_primary_until"
+
+_local = threading.local()
+
+
+def read_database():
+    """
+    The alias the current thread reads from, None for the default routing.
+    """
+    return getattr(_local, "alias", None)
+
+
+@contextmanager
+def reading_from(alias):
+    """
+    Route the reads made within to ``alias``, or leave them alone if it's None.
+    """
+    previous = read_database()
+    _local.alias = alias
+    try:
+        yield
+    finally:
+        _local.alias = previous
+
+
+def remember_write(request):
+    """
+    Keep the reads of a staff member on the default database while the
+    replica may not have their changes yet.
+    """
+    if settings.EVENTS_READ_DATABASE and hasattr(request, "session"):
+        request.session[SESSION_KEY] = time() + settings.EVENTS_READ_DATABASE_LAG
+
+
+def replica_for(request):
+    """
+    The alias a request should read from, None if it should use the default database.
+    """
+    alias = settings.EVENTS_READ_DATABASE
+    if not alias or alias not in django_settings.DATABASES:
+        return None
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        if request.session.get(SESSION_KEY, 0) > time():
+            return None
+    return alias
+
+
+def use_replica(view):
+    """
+    Run a read-only view, template rendering included, against the replica.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with reading_from(replica_for(request)):
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter(object):
+    """
+    Sends reads of the models of this app to the alias chosen by
+    ``reading_from()``, sessions, users and the rest of the project keep
+    using the default database. Instances read from the replica are saved
+    to the default database, not back to where they came from.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == "mezzanine_events":
+            return read_database()
+        return None
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db == settings.EVENTS_READ_DATABASE:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = (DEFAULT_DB_ALIAS, settings.EVENTS_READ_DATABASE)
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
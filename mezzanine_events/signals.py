@@ -0,0 +1,126 @@
+from __future__ import absolute_import, unicode_literals
+
+import threading
+
+from contextlib import contextmanager
+from functools import wraps
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from mezzanine.conf import settings
+
+from . import archive, warmup
+from .caching import invalidate
+from .models import Event, EventCategory, Occurrence
+
+_local = threading.local()
+
+
+@contextmanager
+def paused():
+    """
+    Ignore the changes to occurrences made within, e.g. while they're moved
+    to the archive table. The caller takes care of the caches.
+    """
+    _local.paused = True
+    try:
+        yield
+    finally:
+        _local.paused = False
+
+
+def unless_paused(receiver_func):
+    @wraps(receiver_func)
+    def wrapper(*args, **kwargs):
+        if not getattr(_local, "paused", False):
+            receiver_func(*args, **kwargs)
+
+    return wrapper
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Occurrence)
+@receiver(post_delete, sender=Occurrence)
+@receiver(post_save, sender=EventCategory)
+@receiver(post_delete, sender=EventCategory)
+@unless_paused
+def invalidate_site_cache(sender, instance, **kwargs):
+    invalidate(instance.site_id)
+
+
+@receiver(m2m_changed, sender=Event.categories.through)
+def invalidate_site_cache_categories(sender, instance, **kwargs):
+    invalidate(instance.site_id)
+
+
+@receiver(post_save, sender=Occurrence)
+@receiver(post_delete, sender=Occurrence)
+@unless_paused
+def update_event_dates(sender, instance, **kwargs):
+    # The event is gone when the occurrence is deleted along with it
+    for event in Event._base_manager.filter(pk=instance.event_id):
+        event.update_dates()
+
+
+@receiver(pre_save, sender=Occurrence)
+@unless_paused
+def uncount_old_occurrence(sender, instance, raw, **kwargs):
+    if instance.pk and not raw:
+        for old in Occurrence.objects.filter(pk=instance.pk):
+            archive.count_occurrence(old, -1)
+
+
+@receiver(post_save, sender=Occurrence)
+@unless_paused
+def count_occurrence(sender, instance, raw, **kwargs):
+    if not raw:
+        archive.count_occurrence(instance)
+
+
+@receiver(post_delete, sender=Occurrence)
+@unless_paused
+def uncount_occurrence(sender, instance, **kwargs):
+    archive.count_occurrence(instance, -1)
+
+
+@receiver(pre_save, sender=Event)
+def remember_event_state(sender, instance, raw, **kwargs):
+    instance._archive_state = archive.event_state(instance.pk) if instance.pk else None
+
+
+@receiver(post_save, sender=Event)
+def recount_event(sender, instance, raw, **kwargs):
+    if not raw:
+        archive.recount_event(instance.pk, instance._archive_state)
+
+
+@receiver(pre_delete, sender=Event)
+def start_event_deletion(sender, instance, **kwargs):
+    archive.start_event_deletion(instance)
+
+
+@receiver(post_delete, sender=Event)
+def end_event_deletion(sender, instance, **kwargs):
+    archive.end_event_deletion(instance)
+
+
+@receiver(m2m_changed, sender=Event.categories.through)
+def recount_event_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # Categories can be changed from the category side too
+        event_ids = pk_set or instance.events.values_list("pk", flat=True)
+    else:
+        event_ids = [instance.pk]
+    if action.startswith("pre_"):
+        instance._archive_states = dict((pk, archive.event_state(pk)) for pk in event_ids)
+    else:
+        for pk, state in getattr(instance, "_archive_states", {}).items():
+            archive.recount_event(pk, state)
+
+
+@receiver(post_save, sender=Event)
+def warm_event_cache(sender, instance, raw, **kwargs):
+    if settings.EVENTS_WARM_CACHE_ON_SAVE and not raw:
+        warmup.warm_event(instance)
@@ -1,18 +1,23 @@
 from __future__ import absolute_import, unicode_literals
 
-from datetime import timedelta
-from itertools import groupby, islice
+from datetime import date
 from operator import itemgetter
 
 from django import template
-from django.template.defaultfilters import urlencode
 from django.template.loader import get_template
 from django.utils.timezone import now
 
 from mezzanine.utils.sites import current_request
 
+from ..archive import archive_months
+from ..caching import cached
+from ..calendar_links import for_request
+from ..expansion import get_expander
+from ..formatting import get_formatter
 from ..models import EventCategory, Occurrence
-from ..utils import duration_info
+from ..records import load_listing
+from ..routing import reading_from, replica_for
+from ..utils import duration_info, today
 
 register = template.Library()
 register.simple_tag(duration_info)
@@ -20,24 +25,21 @@ register.simple_tag(duration_info)
 
 @register.filter(is_safe=True)
 def google_calendar_url(dt):
-    start_str = dt.start.strftime("%Y%m%dT%H%M%SZ")
-    end = dt.end or (dt.start + timedelta(hours=1))
-    end_str = end.strftime("%Y%m%dT%H%M%SZ")
-    tokens = {
-        "action": "TEMPLATE",
-        "text": dt.event.title,
-        "dates": "{}/{}".format(start_str, end_str),
-        "details": current_request().build_absolute_uri(dt.event.get_absolute_url()),
-        "location": dt.event.location.replace("\n", " "),
-    }
-
-    if dt.repeat:
-        tokens["recur"] = dt.repeat
-        if dt.repeat_until:
-            tokens["recur"] += ";UNTIL=" + dt.repeat_until.strftime("%Y%m%d")
-
-    pairs = ("{}={}".format(k, urlencode(v)) for k, v in tokens.items())
-    return "https://www.google.com/calendar/event?" + "&".join(pairs)
+    return for_request(current_request()).links(dt).google
+
+
+@register.filter
+def calendar_links(value):
+    """
+    Google, Outlook and ICS links of an occurrence or of a (start, end,
+    occurrence) tuple, unless the view already attached them.
+    """
+    if hasattr(value, "links"):
+        return value.links
+    links = for_request(current_request())
+    if isinstance(value, tuple):
+        return links.links(value[2], value[0], value[1])
+    return links.links(value)
 
 
 @register.simple_tag(takes_context=True)
@@ -51,6 +53,11 @@ def upcoming_occurrences(
     Return a limited number of upcoming event occurrences.
     Optionally can be filtered by category slug.
     """
+    with reading_from(replica_for(current_request())):
+        return render_upcoming(context, category_slug, limit, template)
+
+
+def render_upcoming(context, category_slug, limit, template):
     occurrences = Occurrence.objects.published()
     try:
         category = EventCategory.objects.get(slug=category_slug)
@@ -59,12 +66,44 @@ def upcoming_occurrences(
     except EventCategory.DoesNotExist:
         context["category"] = None
 
-    # Sort and group by event (grouping doesn't work without sorting)
-    by_event = lambda x: x[2].event_id
-    occurrence_tuples = occurrences.all_occurrences(from_date=now())
-    occurrence_tuples = sorted(occurrence_tuples, key=by_event)
-    unique_occurrences = (next(tuples) for event, tuples in groupby(occurrence_tuples, by_event))
-    # Sort by the first item (start date) again
-    unique_occurrences = sorted(unique_occurrences, key=itemgetter(0))
-    context["occurrences"] = islice(unique_occurrences, limit)
+    def get_unique_occurrences():
+        # Only the next repetition of each occurrence can be the first of its event.
+        # The events are loaded along with the occurrences in a single query.
+        expander = get_expander()
+        when = now()
+        first = {}
+        for occurrence in load_listing(occurrences.for_period(from_date=when)):
+            for occurrence_tuple in expander.expand(occurrence, when, limit=1):
+                current = first.get(occurrence.event_id)
+                if current is None or occurrence_tuple[0] < current[0]:
+                    first[occurrence.event_id] = occurrence_tuple
+        return sorted(first.values(), key=itemgetter(0))[:limit]
+
+    occurrence_tuples = cached(get_unique_occurrences, "upcoming", category_slug, limit)
+    occurrence_tuples = get_formatter().label_all(occurrence_tuples)
+    context["occurrences"] = for_request(current_request()).link_all(occurrence_tuples)
+    return get_template(template).render(context.flatten())
+
+
+@register.simple_tag(takes_context=True)
+def occurrence_heatmap(
+    context,
+    year=None,
+    category_slug=None,
+    levels=4,
+    template="mezzanine_events/includes/occurrence_heatmap.html",
+):
+    """
+    Number of occurrences in each month of a year (the current one by
+    default), read from the archive counts. Each month also gets a level
+    from 0 to ``levels``, relative to the busiest month of the year.
+    """
+    year = int(year or today().year)
+    with reading_from(replica_for(current_request())):
+        counts = archive_months(category_slug, year)
+    counts = dict(((y, m), count) for y, m, count in counts)
+    months = [(date(year, m, 1), counts.get((year, m), 0)) for m in range(1, 13)]
+    busiest = max(count for dt, count in months) or 1
+    context["year"] = year
+    context["months"] = [(dt, count, -(-count * levels // busiest)) for dt, count in months]
     return get_template(template).render(context.flatten())
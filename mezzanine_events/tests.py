@@ -1,8 +1,1245 @@
 from __future__ import absolute_import, unicode_literals
 
-from django.test import TestCase
+import json
+import random
+import re
+import threading
+
+from collections import Counter
+from datetime import date, datetime, timedelta
+from math import asin, atan2, cos, degrees, radians, sin
+from time import sleep, time
+from unittest import skipUnless
+
+from django.conf import settings as django_settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import IntegrityError, connection, connections, router, transaction
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.template import Context, Template
+from django.template.defaultfilters import date as datefmt, urlencode
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+from django.utils import timezone, translation
+from django.utils.timezone import localtime, make_aware, now, utc
+
+import pytz
+from dateutil.tz import gettz
+
+from eventtools.models import BaseOccurrence
+
+from mezzanine.core.models import CONTENT_STATUS_DRAFT
+from mezzanine.utils.sites import current_site_id, override_current_site_id
+
+from .archive import archive_months, rebuild_counts, recount_published
+from .benchmarks import create_events
+from .caching import generation_key
+from .calendar_links import ics_timezone
+from .concurrency import run_concurrently
+from .conflicts import find_conflicts, sweep
+from . import concurrency, formatting, geo, routing
+from .expansion import Expander, numpy
+from .formatting import get_formatter
+from .models import (
+    ArchivedOccurrence,
+    Event,
+    EventCategory,
+    EventRecommendation,
+    GeocodeCache,
+    Occurrence,
+    OccurrenceCount,
+)
+from .partition import published_occurrences
+from .recommendations import update_recommendations
+from .utils import today
+from .warmup import run, site_tasks
+
+REPEATS = ["", "RRULE:FREQ=DAILY", "RRULE:FREQ=WEEKLY", "RRULE:FREQ=MONTHLY"]
+REPEATS += ["RRULE:FREQ=YEARLY", "RRULE:FREQ=YEARLY", "RRULE:FREQ=WEEKLY;INTERVAL=2"]
+
+# Alias of a second database that ReplicaTest uses as the replica
+REPLICA = "replica"
+
+# Stands for the base template of a project, which the shipped templates extend
+BASE_TEMPLATE = "{% block title %}{% endblock %}{% block main %}{% endblock %}"
 
 
 class SimpleTest(TestCase):
     def dummy_test(self):
         self.assertTrue(True)
+
+
+class SiteTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="events")
+        self.other = Site.objects.create(domain="other.example.com", name="Other")
+        self.start = now().replace(microsecond=0) + timedelta(days=1)
+
+    def test_published(self):
+        """
+        Occurrences belong to the site of their event, even when it moves.
+        """
+        here = Event.objects.create(user=self.user, title="Here")
+        here.occurrences.create(start=self.start)
+        with override_current_site_id(self.other.pk):
+            there = Event.objects.create(user=self.user, title="There")
+            there.occurrences.create(start=self.start)
+            self.assertEqual([o.event for o in Occurrence.objects.published()], [there])
+        self.assertEqual([o.event for o in Occurrence.objects.published()], [here])
+
+        here.site = self.other
+        here.save()
+        self.assertFalse(Occurrence.objects.published().exists())
+
+    def test_invalidation(self):
+        """
+        Changes to the events of a site start a new cache generation for that site only.
+        """
+        site_id = Site.objects.get_current().pk
+        cache.set(generation_key(site_id), 1, None)
+        cache.set(generation_key(self.other.pk), 1, None)
+        event = Event.objects.create(user=self.user, title="Event")
+        self.assertNotEqual(cache.get(generation_key(site_id)), 1)
+
+        cache.set(generation_key(site_id), 1, None)
+        event.occurrences.create(start=self.start)
+        self.assertNotEqual(cache.get(generation_key(site_id)), 1)
+        self.assertEqual(cache.get(generation_key(self.other.pk)), 1)
+
+    def test_import(self):
+        """
+        An event exported by the JSON view is imported into the current site
+        with its occurrences.
+        """
+        event = Event.objects.create(user=self.user, title="Concert")
+        end = self.start + timedelta(hours=2)
+        event.occurrences.create(start=self.start, end=end, repeat="RRULE:FREQ=WEEKLY")
+        response = self.client.get(reverse("mezzanine_events:event_json", args=[event.pk]))
+        data = json.loads(response.content.decode())
+
+        event_admin = admin.site._registry[Event]
+        with override_current_site_id(self.other.pk):
+            imported = event_admin.create_event(data, "http://example.com/", self.user)
+        self.assertEqual(imported.site_id, self.other.pk)
+        self.assertEqual(
+            [(o.start, o.end, o.repeat, o.site_id) for o in imported.occurrences.all()],
+            [(self.start, end, "RRULE:FREQ=WEEKLY", self.other.pk)],
+        )
+
+
+def outcome(func, *args):
+    """
+    The list of tuples generated by ``func``, or the exception it raised.
+    """
+    try:
+        return list(func(*args))
+    except Exception as e:
+        return type(e)
+
+
+def random_datetime(rnd):
+    day = date(2016, 1, 1) + timedelta(days=rnd.randint(0, 3 * 366))
+    if rnd.random() < 0.3:
+        # Month ends, leap days and DST transitions are the interesting cases
+        day = rnd.choice([date(2016, 1, 31), date(2016, 2, 29), date(2016, 3, 13)])
+    dt = datetime.combine(day, datetime.min.time()) + timedelta(
+        hours=rnd.randint(0, 23), minutes=rnd.choice([0, 15, 30])
+    )
+    if dt.day == 13 and dt.month == 3 and dt.hour == 2:
+        dt += timedelta(hours=1)  # Doesn't exist in the timezone
+    return make_aware(dt)
+
+
+def random_occurrence(rnd, **kwargs):
+    start = random_datetime(rnd)
+    end = None
+    if rnd.random() < 0.8:
+        end = start + timedelta(minutes=rnd.choice([30, 90, 60 * 26]))
+    repeat_until = None
+    if rnd.random() < 0.5:
+        repeat_until = (start + timedelta(days=rnd.randint(0, 900))).date()
+    return Occurrence(
+        start=start, end=end, repeat=rnd.choice(REPEATS), repeat_until=repeat_until, **kwargs
+    )
+
+
+def locmem_templates(templates):
+    """
+    TEMPLATES setting to render the views without a project.
+    """
+    loader = ("django.template.loaders.locmem.Loader", templates)
+    return [
+        {
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "OPTIONS": {"loaders": [loader]},
+        }
+    ]
+
+
+def create_event(**kwargs):
+    user, _ = get_user_model().objects.get_or_create(username="events")
+    kwargs.setdefault("title", "Event")
+    return Event.objects.create(user=user, **kwargs)
+
+
+@override_settings(USE_TZ=True, TIME_ZONE="America/New_York")
+class ExpansionTest(SimpleTestCase):
+    """
+    The expander must produce the same results as django-eventtools (dateutil),
+    except for the wall times changed by DST, where django-eventtools raises.
+    """
+
+    def assertSameExpansion(self, expander, seed):
+        rnd = random.Random(seed)
+        for _ in range(300):
+            occ = random_occurrence(rnd)
+            from_date = rnd.choice([None, random_datetime(rnd), date(2017, 5, 31)])
+            to_date = rnd.choice([None, random_datetime(rnd), date(2018, 12, 31)])
+            limit = rnd.choice([1, 10, 200, 5000])
+            expected = outcome(BaseOccurrence.all_occurrences, occ, from_date, to_date, limit)
+            actual = outcome(expander.expand, occ, from_date, to_date, limit)
+            self.assertEqual(actual, expected, (occ.__dict__, from_date, to_date, limit))
+
+    def test_python(self):
+        self.assertSameExpansion(Expander(), seed=1)
+
+    def test_numpy(self):
+        if numpy is None:
+            self.skipTest("NumPy is not installed")
+        expander = Expander()
+        expander.numpy_threshold = 0
+        self.assertSameExpansion(expander, seed=2)
+
+    def test_expand_all(self):
+        rnd = random.Random(3)
+        occurrences = [random_occurrence(rnd) for _ in range(50)]
+        from_date, to_date = date(2017, 1, 1), date(2017, 3, 31)
+        expected = []
+        for occ in occurrences:
+            expected.extend(BaseOccurrence.all_occurrences(occ, from_date, to_date))
+        expected.sort(key=lambda t: t[0])
+        self.assertEqual(Expander().expand_all(occurrences, from_date, to_date), expected)
+
+    def test_dst(self):
+        # Unlike django-eventtools, wall times skipped or repeated by DST don't raise
+        expander = Expander()
+        daily = Occurrence(start=make_aware(datetime(2016, 3, 12, 2, 30)), repeat=REPEATS[1])
+        starts = [s for s, e, d in expander.expand(daily, date(2016, 3, 13), date(2016, 3, 13))]
+        self.assertEqual(starts, [datetime(2016, 3, 13, 7, 30, tzinfo=utc)])  # 3:30 EDT
+        self.assertEqual(len(list(expander.expand(daily, limit=800))), 800)
+        daily.start = make_aware(datetime(2016, 11, 5, 1, 30))
+        starts = [s for s, e, d in expander.expand(daily, date(2016, 11, 6), date(2016, 11, 6))]
+        self.assertEqual(starts, [datetime(2016, 11, 6, 5, 30, tzinfo=utc)])  # 1:30 EDT
+
+
+@override_settings(USE_TZ=True, TIME_ZONE="Asia/Tokyo")
+class OccurrenceMonthTest(TestCase):
+    """
+    Filtering by covered months must not lose any occurrence of a period.
+    """
+
+    def test_for_period(self):
+        rnd = random.Random(4)
+        event = create_event()
+        for _ in range(200):
+            random_occurrence(rnd, event=event).save()
+
+        # Starts in March in Tokyo, but in February in UTC
+        march = Occurrence.objects.create(event=event, start=make_aware(datetime(2017, 3, 1, 5)))
+        with timezone.override(utc):
+            feb = Occurrence.objects.for_period(date(2017, 2, 28), date(2017, 2, 28))
+            self.assertIn(march, feb)
+
+        # Read in other timezones than the one the months were built in
+        for tz in ["Asia/Tokyo", "Pacific/Kiritimati", "Pacific/Pago_Pago"]:
+            with timezone.override(tz):
+                for _ in range(30):
+                    from_date = random_datetime(rnd)
+                    to_date = from_date + timedelta(days=rnd.choice([1, 31, 200]))
+                    qs = Occurrence.objects.all()
+                    expected = []
+                    for occ in qs:
+                        expected.extend(occ.all_occurrences(from_date, to_date))
+                    expected.sort(key=lambda t: t[0])
+                    self.assertEqual(list(qs.all_occurrences(from_date, to_date)), expected)
+
+
+def reset_executor():
+    """
+    Shut down the shared thread pool, the next use starts one with the current settings.
+    """
+    with concurrency._executor_lock:
+        if concurrency._executor is not None:
+            concurrency._executor.shutdown(wait=False)
+        concurrency._executor = None
+
+
+@override_settings(USE_TZ=True, EVENTS_THREAD_POOL_SIZE=2)
+class ConcurrencyTest(SimpleTestCase):
+    def setUp(self):
+        reset_executor()
+        self.addCleanup(reset_executor)
+
+    def test_run_concurrently(self):
+        def state(i):
+            def get():
+                # Give the other tasks time to finish first
+                sleep(0.05 * (3 - i))
+                thread = threading.current_thread()
+                tz = timezone.get_current_timezone_name()
+                return i, current_site_id(), tz, translation.get_language(), thread
+
+            return get
+
+        funcs = [state(i) for i in range(3)]
+        with override_current_site_id(7), timezone.override("Asia/Kolkata"):
+            with translation.override("es"):
+                # Stays the default language without USE_I18N
+                language = translation.get_language()
+                results = run_concurrently(*funcs)
+        self.assertEqual(
+            [r[:4] for r in results], [(i, 7, "Asia/Kolkata", language) for i in range(3)]
+        )
+        self.assertIs(results[0][4], threading.current_thread())
+        self.assertNotIn(threading.current_thread(), [r[4] for r in results[1:]])
+
+
+@override_settings(EVENTS_LISTING_RECORDS=True)
+class ListingTest(TestCase):
+    def test_listing(self):
+        rnd = random.Random(6)
+        for i in range(5):
+            event = create_event(title="Event {}".format(i), content="Long text " * 1000)
+            for _ in range(5):
+                random_occurrence(rnd, event=event).save()
+
+        from_date, to_date = date(2017, 1, 1), date(2018, 12, 31)
+        qs = Occurrence.objects.select_related("event")
+        expected = list(qs.all_occurrences(from_date, to_date))
+        actual = list(qs.listing(from_date, to_date))
+        self.assertEqual(
+            [(t[0], t[1], t[2].pk, t[2].event.title) for t in actual],
+            [(t[0], t[1], t[2].pk, t[2].event.title) for t in expected],
+        )
+        self.assertEqual(str(actual[0][2]), str(expected[0][2]))
+        self.assertEqual(
+            actual[0][2].event.get_absolute_url(), expected[0][2].event.get_absolute_url()
+        )
+
+        # Repetitions share the same event record
+        events = dict((t[2].event_id, t[2].event) for t in actual)
+        self.assertTrue(all(t[2].event is events[t[2].event_id] for t in actual))
+
+    @override_settings(
+        TEMPLATES=locmem_templates(
+            {
+                "mezzanine_events/event_grid.html": "{% for week in calendar %}"
+                "{% for day, occurrences in week %}{% for o in occurrences %}"
+                "{{ o.2.event.title }} {% endfor %}{% endfor %}{% endfor %}"
+            }
+        )
+    )
+    def test_categories(self):
+        """
+        Events in several of the selected categories are listed once.
+        """
+        music = EventCategory.objects.create(title="Music")
+        theatre = EventCategory.objects.create(title="Theatre")
+        event = create_event(title="Opera")
+        event.categories.add(music, theatre)
+        start = now() + timedelta(days=1)
+        event.occurrences.create(start=start)
+        url = reverse("mezzanine_events:event_grid", args=[start.year, start.month])
+        response = self.client.get(url, {"categories": [music.pk, theatre.pk]})
+        self.assertEqual(response.content.decode(), "Opera ")
+
+    @override_settings(EVENTS_LISTING_RECORDS=False)
+    def test_models(self):
+        """
+        Listings have model instances unless records are enabled.
+        """
+        event = create_event(content="Long text")
+        Occurrence.objects.create(event=event, start=now(), repeat="RRULE:FREQ=DAILY")
+        with self.assertNumQueries(1):
+            occurrence_tuples = list(Occurrence.objects.listing(now(), limit=3))
+            self.assertEqual([t[2].event.content for t in occurrence_tuples], ["Long text"] * 3)
+        self.assertIsInstance(occurrence_tuples[0][2], Occurrence)
+
+
+class ConflictTest(TestCase):
+    def test_sweep(self):
+        rnd = random.Random(5)
+
+        def intervals(count):
+            out = []
+            for i in range(count):
+                start = rnd.randint(0, 500)
+                out.append((start, start + rnd.randint(1, 30), i))
+            return out
+
+        existing, proposed = intervals(200), intervals(50)
+        expected = [
+            (i, j)
+            for i, a in enumerate(existing)
+            for j, b in enumerate(proposed)
+            if a[0] < b[1] and b[0] < a[1]
+        ]
+        self.assertEqual(sorted(sweep(existing, proposed)), expected)
+
+    def test_find_conflicts(self):
+        start = make_aware(datetime(2019, 9, 2, 18))  # Monday
+        hall = create_event(title="Weekly class", location="Hall")
+        hall.occurrences.create(
+            start=start, end=start + timedelta(hours=2), repeat="RRULE:FREQ=WEEKLY"
+        )
+        create_event(location="Elsewhere").occurrences.create(
+            start=start, end=start + timedelta(hours=2)
+        )
+
+        # Every other Monday for two months, overlapping the class by an hour
+        proposed = start + timedelta(hours=1)
+        conflicts = find_conflicts(
+            "Hall",
+            proposed,
+            proposed + timedelta(hours=2),
+            "RRULE:FREQ=WEEKLY;INTERVAL=2",
+            date(2019, 10, 31),
+        )
+        self.assertEqual([c.start.day for c in conflicts], [2, 16, 30, 14, 28])
+        self.assertTrue(all(c.occurrence.event == hall for c in conflicts))
+
+        # Back to back is fine, and an event doesn't conflict with itself
+        self.assertEqual(find_conflicts("Hall", start + timedelta(hours=2)), [])
+        self.assertEqual(find_conflicts("Hall", start, exclude_event=hall.pk), [])
+
+
+def destination(latitude, longitude, bearing, km):
+    """
+    The point at a distance and bearing (in degrees) from another one.
+    """
+    lat, lon, bearing, d = map(radians, (latitude, longitude, bearing, km / geo.KM_PER_DEGREE))
+    lat2 = asin(sin(lat) * cos(d) + cos(lat) * sin(d) * cos(bearing))
+    lon2 = lon + atan2(sin(bearing) * sin(d) * cos(lat), cos(d) - sin(lat) * sin(lat2))
+    return degrees(lat2), (degrees(lon2) + 180) % 360 - 180
+
+
+@override_settings(
+    EVENTS_GEOCODER_TABLE={
+        "Plaza Mayor, Madrid": (40.4155, -3.7074),
+        "Alcala de Henares": (40.482, -3.364),
+        "Toledo": (39.8628, -4.0273),
+        "Barcelona": (41.3874, 2.1686),
+    }
+)
+class GeoTest(TestCase):
+    def setUp(self):
+        # The geocoders read their settings once
+        geo._geocoders.clear()
+        self.addCleanup(geo._geocoders.clear)
+
+    def test_geohash(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+        rnd = random.Random(3)
+        for i in range(500):
+            lat, lon = rnd.uniform(-80, 80), rnd.uniform(-180, 180)
+            radius = rnd.choice([0.1, 2, 30, 200])
+            cells = geo.neighbours(lat, lon, geo.search_precision(lat, radius))
+            point = destination(lat, lon, rnd.uniform(0, 360), radius * 0.999)
+            self.assertLess(abs(geo.distance(lat, lon, *point) - radius * 0.999), 0.01 * radius)
+            geohash = geo.encode(*point)
+            self.assertTrue(any(geohash.startswith(cell) for cell in cells), (lat, lon, radius))
+
+    def test_nearby(self):
+        start = now() + timedelta(days=1)
+        for title, address in [
+            ("Madrid", "plaza mayor,  madrid"),
+            ("Alcala", "Alcala de Henares"),
+            ("Toledo", "Toledo"),
+            ("Barcelona", "Barcelona"),
+            ("Unknown", "Nowhere"),
+        ]:
+            event = create_event(title=title, address=address)
+            event.occurrences.create(start=start, end=start + timedelta(hours=1))
+            event.occurrences.create(start=start + timedelta(days=len(title)))
+        self.assertEqual(Event.objects.get(title="Madrid").geohash[:5], "ezjmg")
+        self.assertEqual(Event.objects.get(title="Unknown").latitude, None)
+        self.assertEqual(GeocodeCache.objects.filter(latitude__isnull=True).count(), 1)
+
+        with override_current_site_id(Site.objects.get().pk), self.assertNumQueries(1):
+            occurrences = Occurrence.objects.published().nearby(40.4168, -3.7038, 100)
+        self.assertEqual(
+            [(o[2].event.title, o[0] - start) for o in occurrences],
+            [(t, timedelta(days)) for days in (0, 6) for t in ("Madrid", "Alcala", "Toledo")],
+        )
+        self.assertAlmostEqual(occurrences[1].distance, 29.65, places=2)
+
+        url = reverse("mezzanine_events:event_nearby")
+        response = self.client.get(url, {"lat": 40.4168, "lng": -3.7038, "radius": 40})
+        self.assertEqual(
+            [o["title"] for o in response.json()["occurrences"]], ["Madrid", "Alcala"] * 2
+        )
+        response = self.client.get(url, {"lat": 40.4168, "lng": -3.7038, "radius": 1000})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {"lat": 40.4155, "lng": -3.7074, "radius": 0})
+        self.assertEqual([o["title"] for o in response.json()["occurrences"]], ["Madrid"] * 2)
+        response = self.client.get(url, {"lat": 40.4155, "lng": -3.7074, "radius": 0.001})
+        self.assertEqual(len(response.json()["occurrences"]), 2)
+        response = self.client.get(url, {"lat": 40.4168, "lng": -3.7038})
+        self.assertEqual(len(response.json()["occurrences"]), 2)
+
+        Event.objects.update(latitude=None, longitude=None, geohash="")
+        call_command("geocode_events", stdout=StringIO())
+        self.assertEqual(Event.objects.exclude(geohash="").count(), 4)
+
+    def test_address_change(self):
+        """
+        Geocoded coordinates follow the address, those entered by hand stay.
+        """
+        event = create_event(address="Toledo")
+        event = Event.objects.get(pk=event.pk)
+        event.address = "Barcelona"
+        event.save()
+        self.assertEqual((event.latitude, event.longitude), (41.3874, 2.1686))
+        event.address = "Toledo"
+        event.save()
+        self.assertEqual((event.latitude, event.longitude), (39.8628, -4.0273))
+
+        event.latitude, event.longitude = 39.86, -4.02
+        event.save()
+        event = Event.objects.get(pk=event.pk)
+        event.address = "Barcelona"
+        event.save()
+        self.assertEqual((event.latitude, event.longitude), (39.86, -4.02))
+
+
+@override_settings(USE_TZ=True, TIME_ZONE="UTC")
+class EventDatesTest(TestCase):
+    def test_event_dates(self):
+        start = now().replace(microsecond=0) - timedelta(days=10)
+        event = create_event()
+        self.assertEqual((event.next_start, event.last_end), (None, None))
+
+        weekly = event.occurrences.create(
+            start=start,
+            end=start + timedelta(hours=1),
+            repeat="RRULE:FREQ=WEEKLY",
+            repeat_until=(start + timedelta(days=30)).date(),
+        )
+        event.occurrences.create(start=start, end=start + timedelta(hours=2))
+        event.refresh_from_db()
+        self.assertEqual(event.next_start, start + timedelta(days=14))
+        self.assertEqual(event.last_end, start + timedelta(days=28, hours=1))
+        self.assertEqual(list(Event.objects.upcoming()), [event])
+        self.assertEqual(list(Event.objects.past()), [])
+
+        # Rolled forward as time passes
+        event.update_dates(when=start + timedelta(days=20))
+        self.assertEqual(event.next_start, start + timedelta(days=21))
+
+        weekly.delete()
+        event.refresh_from_db()
+        self.assertEqual((event.next_start, event.last_end), (None, start + timedelta(hours=2)))
+        self.assertEqual(list(Event.objects.past()), [event])
+
+        event.occurrences.create(
+            start=start, end=start + timedelta(hours=1), repeat="RRULE:FREQ=DAILY"
+        )
+        Event.objects.filter(pk=event.pk).update(next_start=start)
+        call_command("update_event_dates", stdout=StringIO())
+        event.refresh_from_db()
+        self.assertEqual((event.next_start, event.last_end), (start + timedelta(days=10), None))
+        self.assertEqual(list(Event.objects.upcoming()), [event])
+
+
+def reference_duration(start, end):
+    """
+    ``duration_info`` as implemented with the ``date`` filter.
+    """
+    local_start = localtime(start)
+    out = datefmt(local_start, "DATETIME_FORMAT")
+    if end not in (None, start):
+        local_end = localtime(end)
+        if local_end.date() == local_start.date():
+            out += " to {}".format(datefmt(local_end, "TIME_FORMAT"))
+        else:
+            out += " to {}".format(datefmt(local_end, "DATETIME_FORMAT"))
+    return out
+
+
+@override_settings(USE_TZ=True, USE_L10N=True)
+class FormattingTest(SimpleTestCase):
+    def setUp(self):
+        # The formatters read the format settings once
+        formatting._formatters.clear()
+        self.addCleanup(formatting._formatters.clear)
+
+    def test_duration(self):
+        rnd = random.Random(7)
+        for language in ("en", "es", "de", "fr", "ja"):
+            for tz in ("UTC", "Europe/Madrid", "America/New_York", "Asia/Kolkata"):
+                with translation.override(language), timezone.override(tz):
+                    formatter = get_formatter()
+                    for i in range(40):
+                        start = random_datetime(rnd)
+                        end = rnd.choice(
+                            [None, start, start + timedelta(hours=rnd.randint(1, 50))]
+                        )
+                        self.assertEqual(
+                            formatter.duration(start, end), reference_duration(start, end)
+                        )
+                    self.assertIs(get_formatter(), formatter)
+
+    def test_label_all(self):
+        start = make_aware(datetime(2016, 3, 13, 10))
+        occurrence_tuples = [(start, start + timedelta(hours=1), "occurrence")]
+        labeled = get_formatter().label_all(occurrence_tuples)
+        self.assertEqual(labeled, occurrence_tuples)
+        self.assertEqual(labeled[0].label, reference_duration(*occurrence_tuples[0][:2]))
+        start, end, occurrence = labeled[0]
+        self.assertEqual(occurrence, "occurrence")
+
+
+@override_settings(
+    USE_TZ=True,
+    TIME_ZONE="Europe/Madrid",
+    TEMPLATES=locmem_templates(
+        {
+            "mezzanine_events/event_list.html": "{% load events_tags %}{% autoescape off %}"
+            "{% for o in occurrences %}{{ o.links.outlook }} {{ o.2|google_calendar_url }}\n"
+            "{% endfor %}{% endautoescape %}"
+        }
+    ),
+)
+class CalendarLinksTest(TestCase):
+    def test_links(self):
+        event = create_event(title="Concert, live", location="Main hall\nRoom 2")
+        tomorrow = today() + timedelta(days=1)
+        start = make_aware(datetime.combine(tomorrow, datetime.min.time())) + timedelta(hours=20)
+        event.occurrences.create(
+            start=start,
+            end=start + timedelta(hours=2),
+            repeat="RRULE:FREQ=WEEKLY",
+            repeat_until=tomorrow + timedelta(days=14),
+        )
+        response = self.client.get(reverse("mezzanine_events:event_list"))
+        lines = response.content.decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(len(set(line.split()[1] for line in lines)), 1)
+        google = lines[0].split()[1]
+        self.assertIn("text=Concert%2C%20live&details=http%3A//testserver/events/event/", google)
+        self.assertIn("location=Main%20hall%20Room%202", google)
+        self.assertIn("dates={}/".format(start.astimezone(utc).strftime("%Y%m%dT%H%M%SZ")), google)
+        until = (tomorrow + timedelta(days=14)).strftime("%Y%m%d")
+        self.assertIn("recur=RRULE%3AFREQ%3DWEEKLY%3BUNTIL%3D" + until, google)
+        week = make_aware(localtime(start).replace(tzinfo=None) + timedelta(days=7))
+        self.assertIn("startdt={}&".format(urlencode(week.astimezone(utc).isoformat())), lines[1])
+
+        response = self.client.get(reverse("mezzanine_events:event_ics", args=[event.slug]))
+        self.assertEqual(response["Content-Type"], "text/calendar")
+        content = response.content.decode()
+        stamp = localtime(start).strftime("%Y%m%dT%H%M%S")
+        self.assertIn("DTSTART;TZID=Europe/Madrid:{}\r\n".format(stamp), content)
+        self.assertIn("RRULE:FREQ=WEEKLY;UNTIL=", content)
+        self.assertIn("SUMMARY:Concert\\, live\r\nLOCATION:Main hall\\nRoom 2\r\n", content)
+        self.assertIn("BEGIN:VTIMEZONE\r\nTZID:Europe/Madrid\r\n", content)
+        self.assertIn("TZOFFSETFROM:+0100\r\nTZOFFSETTO:+0200\r\nTZNAME:CEST\r\n", content)
+
+        # Lines are folded at 75 octets, not characters
+        event.title = "Caf\xe9 " * 30
+        event.save()
+        response = self.client.get(reverse("mezzanine_events:event_ics", args=[event.slug]))
+        lines = response.content.split(b"\r\n")
+        self.assertTrue(all(len(line) <= 75 for line in lines))
+        unfolded = response.content.decode("utf-8").replace("\r\n ", "")
+        self.assertIn("SUMMARY:" + event.title + "\r\n", unfolded)
+
+    def test_timezone(self):
+        """
+        Timezones without the pytz transition table are probed, only the
+        observance in effect when the period starts differs.
+        """
+        probed = ics_timezone(gettz("Europe/Madrid"), "Europe/Madrid", 2016, 2018)
+        table = ics_timezone(pytz.timezone("Europe/Madrid"), "Europe/Madrid", 2016, 2018)
+        self.assertEqual(probed[:2], table[:2])
+        self.assertEqual(probed[8:], table[8:])
+        self.assertEqual(len(ics_timezone(utc, "UTC", 2016)), 9)
+
+
+@override_settings(USE_TZ=True, TIME_ZONE="Europe/Madrid")
+class ArchiveTest(TestCase):
+    def assertCountsRebuilt(self):
+        """
+        The incrementally maintained counts must match a full recount.
+        """
+        fields = ["site_id", "year", "month", "category_id", "count"]
+        counts = set(OccurrenceCount.objects.values_list(*fields))
+        rebuild_counts()
+        self.assertEqual(counts, set(OccurrenceCount.objects.values_list(*fields)))
+
+    def test_counts(self):
+        music = EventCategory.objects.create(title="Music")
+        theatre = EventCategory.objects.create(title="Theatre")
+        start = make_aware(datetime(2015, 3, 10, 20))
+        event = create_event()
+        event.categories.add(music)
+        monthly = event.occurrences.create(
+            start=start, repeat="RRULE:FREQ=MONTHLY", repeat_until=date(2015, 8, 1)
+        )
+        event.occurrences.create(start=start + timedelta(days=400))
+        self.assertEqual(archive_months(), [(2015, m, 1) for m in range(3, 8)] + [(2016, 4, 1)])
+        self.assertEqual(len(archive_months("music", 2015)), 5)
+        self.assertCountsRebuilt()
+
+        monthly.repeat = "RRULE:FREQ=WEEKLY"
+        monthly.save()
+        self.assertCountsRebuilt()
+        theatre.events.add(event)
+        self.assertCountsRebuilt()
+        event.categories.remove(music)
+        self.assertCountsRebuilt()
+        event.status = 1
+        event.save()
+        self.assertEqual(archive_months(), [])
+        self.assertCountsRebuilt()
+        event.status = 2
+        event.save()
+        other = create_event(title="Other")
+        other.occurrences.create(start=start)
+        other.categories.add(theatre)
+        monthly.delete()
+        self.assertCountsRebuilt()
+        event.delete()
+        self.assertEqual(archive_months(), [(2015, 3, 1)])
+        self.assertCountsRebuilt()
+
+        with override_current_site_id(Site.objects.get().pk), self.assertNumQueries(1):
+            archive_months("theatre")
+
+    def test_publish_dates(self):
+        """
+        Events are counted while ``published()`` shows them, and recounted
+        once their publish or expiry date passes.
+        """
+        start = make_aware(datetime(2015, 3, 10, 20))
+        event = create_event(publish_date=now() + timedelta(hours=1))
+        event.occurrences.create(start=start)
+        self.assertEqual(archive_months(), [])
+        self.assertCountsRebuilt()
+
+        # As if the publish date passed
+        Event.objects.filter(pk=event.pk).update(publish_date=now() - timedelta(hours=1))
+        stdout = StringIO()
+        call_command("update_occurrence_counts", stdout=stdout)
+        self.assertIn("Recounted 1 events", stdout.getvalue())
+        self.assertEqual(archive_months(), [(2015, 3, 1)])
+        self.assertCountsRebuilt()
+        self.assertEqual(recount_published(), 0)
+
+        # Saving an instance loaded before keeps the counts right
+        event.publish_date = now() - timedelta(hours=1)
+        event.save()
+        self.assertEqual(archive_months(), [(2015, 3, 1)])
+        self.assertTrue(Event.objects.get(pk=event.pk).counted)
+        event.occurrences.create(start=start)
+        self.assertEqual(archive_months(), [(2015, 3, 2)])
+
+        Event.objects.filter(pk=event.pk).update(expiry_date=now() - timedelta(minutes=1))
+        self.assertEqual(recount_published(), 1)
+        self.assertEqual(archive_months(), [])
+        self.assertCountsRebuilt()
+
+    @override_settings(EVENTS_COUNT_HORIZON=380)
+    def test_open_ended(self):
+        """
+        Repetitions without an end are counted up to a date that doesn't
+        move, so they are subtracted as they were added.
+        """
+        start = now().replace(microsecond=0) - timedelta(days=400)
+        occurrence = create_event().occurrences.create(start=start, repeat="RRULE:FREQ=MONTHLY")
+        months = archive_months()
+        self.assertEqual(sum(count for y, m, count in months), 13)
+        self.assertEqual(months[-1][:2], (localtime(start).year + 1, localtime(start).month))
+        self.assertCountsRebuilt()
+        occurrence.delete()
+        self.assertFalse(OccurrenceCount.objects.exists())
+
+        # Totals are unique even though their category is null
+        OccurrenceCount.objects.create(site_id=occurrence.site_id, year=2016, month=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OccurrenceCount.objects.create(site_id=occurrence.site_id, year=2016, month=1)
+
+    @override_settings(
+        TEMPLATES=locmem_templates(
+            {
+                "mezzanine_events/event_archive_year.html": "{{ months }}",
+                "mezzanine_events/event_archive_month.html": "{% for o in occurrences %}"
+                "{{ o.2.event.title }} {% endfor %}{{ years }}",
+            }
+        )
+    )
+    def test_views(self):
+        start = make_aware(datetime(2016, 2, 29, 23))
+        create_event(title="Leap").occurrences.create(start=start, end=start + timedelta(hours=2))
+        response = self.client.get(reverse("mezzanine_events:event_archive_year", args=[2016]))
+        self.assertContains(response, "datetime.date(2016, 2, 1), 1")
+        response = self.client.get(reverse("mezzanine_events:event_archive_month", args=[2016, 2]))
+        self.assertContains(response, "Leap [2016]")
+        response = self.client.get(reverse("mezzanine_events:event_archive_month", args=[2016, 3]))
+        self.assertContains(response, "Leap [2016]")
+        response = self.client.get(
+            reverse("mezzanine_events:event_archive_month", args=[2016, 4]), {"category": "none"}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(
+    USE_TZ=True,
+    TIME_ZONE="UTC",
+    EVENTS_ARCHIVE_DAYS=30,
+    TEMPLATES=locmem_templates(
+        {
+            "mezzanine_events/event_archive_month.html": "{% for o in occurrences %}"
+            "{{ o.2.event.title }} {% endfor %}"
+        }
+    ),
+)
+class PartitionTest(TestCase):
+    def test_archive(self):
+        start = now().replace(microsecond=0) - timedelta(days=400)
+        event = create_event(title="Old")
+        old = event.occurrences.create(start=start, end=start + timedelta(hours=2))
+        weekly = event.occurrences.create(
+            start=start,
+            repeat="RRULE:FREQ=WEEKLY",
+            repeat_until=(start + timedelta(days=300)).date(),
+        )
+        event.occurrences.create(start=now() - timedelta(days=10))
+        event.occurrences.create(start=start, repeat="RRULE:FREQ=MONTHLY")
+        future = event.occurrences.create(start=now() + timedelta(days=10))
+        months = archive_months()
+        event.refresh_from_db()
+        dates = (event.next_start, event.last_end)
+
+        out = StringIO()
+        call_command("archive_past_occurrences", "--batch-size", "2", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Archived 2 occurrences")
+        self.assertEqual(
+            sorted(ArchivedOccurrence.objects.values_list("original_id", flat=True)),
+            [old.pk, weekly.pk],
+        )
+        self.assertEqual(Occurrence.objects.count(), 3)
+        self.assertEqual(archive_months(), months)
+        self.assertEqual(rebuild_counts(), len(OccurrenceCount.objects.all()))
+        self.assertEqual(archive_months(), months)
+        event.update_dates()
+        self.assertEqual((event.next_start, event.last_end), dates)
+        Occurrence.objects.exclude(pk=future.pk).delete()
+        future.delete()
+        event.refresh_from_db()
+        self.assertEqual(event.last_end, start + timedelta(days=294))
+
+        with override_current_site_id(Site.objects.get().pk):
+            self.assertEqual(len(published_occurrences(now() - timedelta(days=29))), 1)
+            self.assertEqual(len(published_occurrences(now() - timedelta(days=31))), 2)
+        url = reverse("mezzanine_events:event_archive_month", args=[start.year, start.month])
+        self.assertContains(self.client.get(url), "Old Old ")
+
+        # Only archived occurrences are left, they are exported as they were
+        url = reverse("mezzanine_events:event_json", args=[event.pk])
+        data = json.loads(self.client.get(url).content.decode())
+        self.assertEqual(
+            sorted((o["model"], o["pk"]) for o in data["occurrences"]),
+            [("mezzanine_events.occurrence", old.pk), ("mezzanine_events.occurrence", weekly.pk)],
+        )
+        url = reverse("mezzanine_events:event_ics", args=[event.slug])
+        content = self.client.get(url).content.decode()
+        uids = sorted(int(pk) for pk in re.findall(r"UID:occurrence-(\d+)@", content))
+        self.assertEqual(uids, [old.pk, weekly.pk])
+        self.assertIn("RRULE:FREQ=WEEKLY;UNTIL=", content)
+        with override_current_site_id(Site.objects.get().pk):
+            self.assertEqual(ArchivedOccurrence.objects.past().count(), 2)
+        self.assertEqual(event.duplicate().occurrences.count(), 2)
+        Event.objects.filter(title__startswith="[Duplicate]").delete()
+
+        out = StringIO()
+        call_command("archive_past_occurrences", "--restore", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Restored 2 occurrences")
+        self.assertEqual(
+            sorted(event.occurrences.values_list("pk", flat=True)), [old.pk, weekly.pk]
+        )
+        self.assertEqual(
+            len(list(Occurrence.objects.listing(start, start + timedelta(days=1)))), 2
+        )
+
+
+@override_settings(
+    EVENTS_RECOMMENDATION_COUNT=2,
+    TEMPLATES=locmem_templates(
+        {
+            "mezzanine_events/event_detail.html": "{% for e in recommended_events %}"
+            "{{ e.slug }} {% endfor %}"
+        }
+    ),
+)
+class RecommendationTest(TestCase):
+    def setUp(self):
+        music = EventCategory.objects.create(title="Music")
+        theatre = EventCategory.objects.create(title="Theatre")
+        start = now() + timedelta(days=7)
+        self.events = {}
+        for slug, title, categories, days in [
+            ("concert", "Jazz concert in the park", [music], 0),
+            ("night", "Jazz night in the park", [music], 1),
+            ("trio", "Piano trio", [music], 2),
+            ("festival", "Jazz festival", [], 300),
+            ("hamlet", "Hamlet", [theatre], 0),
+            ("past", "Jazz concert in the park", [music], -30),
+        ]:
+            event = create_event(slug=slug, title=title)
+            event.categories.add(*categories)
+            event.occurrences.create(start=start + timedelta(days=days))
+            self.events[slug] = event
+
+    def recommended(self):
+        rows = EventRecommendation.objects.order_by("event__slug", "rank")
+        out = {}
+        for slug, recommended in rows.values_list("event__slug", "recommended__slug"):
+            out.setdefault(slug, []).append(recommended)
+        return out
+
+    def test_update(self):
+        self.assertEqual(update_recommendations(), 5)
+        recommended = self.recommended()
+        self.assertEqual(recommended["concert"], ["night", "trio"])
+        self.assertEqual(recommended["past"], ["concert", "night"])
+        self.assertEqual(recommended["festival"], ["concert", "night"])
+        self.assertNotIn("hamlet", recommended)
+
+        with self.assertNumQueries(4):
+            self.assertEqual(update_recommendations(), 0)
+
+        # Only the changed event and the one it's now recommended for are updated
+        Event.objects.filter(slug="hamlet").update(title="Hamlet, a jazz festival")
+        self.assertEqual(update_recommendations(), 2)
+        incremental = self.recommended()
+        self.assertEqual(incremental["festival"], ["hamlet", "concert"])
+        update_recommendations(full=True)
+        self.assertEqual(self.recommended(), incremental)
+
+        # The events that recommended a deleted one get a replacement
+        self.events["night"].delete()
+        update_recommendations()
+        self.assertEqual(self.recommended()["concert"], ["trio", "hamlet"])
+
+    def test_detail(self):
+        update_recommendations()
+        url = self.events["concert"].get_absolute_url()
+        self.assertContains(self.client.get(url), "night trio ")
+        Event.objects.filter(slug="night").update(status=CONTENT_STATUS_DRAFT)
+        self.assertContains(self.client.get(url), "trio ")
+
+    @override_settings(
+        TEMPLATES=[
+            {
+                "BACKEND": "django.template.backends.django.DjangoTemplates",
+                "OPTIONS": {
+                    "loaders": [
+                        ("django.template.loaders.locmem.Loader", {"base.html": BASE_TEMPLATE}),
+                        "django.template.loaders.app_directories.Loader",
+                    ],
+                    "builtins": ["mezzanine.template.loader_tags"],
+                },
+            }
+        ]
+    )
+    def test_detail_template(self):
+        """
+        The shipped detail template lists the related and the recommended events.
+        """
+        update_recommendations()
+        concert = self.events["concert"]
+        concert.related_events.add(self.events["hamlet"])
+        content = self.client.get(concert.get_absolute_url()).content.decode()
+        related, recommended = content.split("You may also like")
+        self.assertIn('href="{}"'.format(self.events["hamlet"].get_absolute_url()), related)
+        self.assertEqual(
+            re.findall(r">([\w ]+)</a>", recommended), ["Jazz night in the park", "Piano trio"]
+        )
+
+
+class EventAdminTest(TestCase):
+    def test_changelist_queries(self):
+        """
+        The number of queries doesn't depend on the number of events listed.
+        """
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(user)
+        url = reverse("admin:mezzanine_events_event_changelist")
+        start = now() + timedelta(days=1)
+
+        def count_queries(events):
+            for i in range(events):
+                event = create_event(title="Event {}".format(i))
+                event.occurrences.create(start=start, repeat="RRULE:FREQ=WEEKLY")
+                event.occurrences.create(start=start + timedelta(days=i))
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, {"next_start": "week"})
+            self.assertEqual(response.status_code, 200)
+            return len(context)
+
+        self.assertEqual(count_queries(2), count_queries(8))
+        response = self.client.get(url, {"o": "5"})
+        self.assertContains(response, '<td class="field-occurrence_count">2</td>', 10)
+
+    def test_ordering(self):
+        """
+        Past events are listed after the upcoming ones, the last to end first.
+        """
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(user)
+        for title, days in [("Old", -30), ("Next", 1), ("Recent", -2), ("Later", 5)]:
+            create_event(title=title).occurrences.create(start=now() + timedelta(days=days))
+        create_event(title="Empty")
+        response = self.client.get(reverse("admin:mezzanine_events_event_changelist"))
+        self.assertEqual(
+            [e.title for e in response.context["cl"].result_list],
+            ["Next", "Later", "Recent", "Old", "Empty"],
+        )
+
+
+def normalize_sql(sql):
+    """
+    A query with its parameters replaced, so repetitions of it can be counted.
+    """
+    sql = re.sub(r"'[^']*'|\b\d+(\.\d+)?\b", "?", sql)
+    return re.sub(r"\(\?(, \?)*\)", "(...)", sql)
+
+
+@override_settings(
+    TEMPLATES=locmem_templates(
+        {
+            "mezzanine_events/event_grid.html": "{% load events_tags %}"
+            "{% for week in calendar %}{% for day, occurrences in week %}"
+            "{% for o in occurrences %}{{ o.label }} {{ o.2.event.title }} "
+            "{{ o.2.event.get_absolute_url }} {{ o.2|google_calendar_url }}"
+            "{% endfor %}{% endfor %}{% endfor %}",
+            "mezzanine_events/event_list.html": "{% load events_tags %}"
+            "{% for o in featured_occurrences %}{{ o.label }} {{ o.2.event.title }}{% endfor %}"
+            "{% for o in occurrences %}{{ o.label }} {{ o.2.event.title }} "
+            "{{ o.2.event.featured_image }} {{ o.2|google_calendar_url }}{% endfor %}",
+            "mezzanine_events/event_detail.html": "{% load events_tags %}{{ event.title }} "
+            "{{ event.user }} {% for o in event.occurrences.all %}{{ o }} "
+            "{{ o|google_calendar_url }}{% endfor %}"
+            "{% for c in event.categories.all %}{{ c }}{% endfor %}"
+            "{% for e in event.related_events.all %}{{ e.title }} {{ e.get_absolute_url }}"
+            "{% for c in e.categories.all %}{{ c }}{% endfor %}{% endfor %}"
+            "{% for e in recommended_events %}{{ e.title }}{% endfor %}",
+            "mezzanine_events/includes/upcoming_occurrences.html": "{% load events_tags %}"
+            "{% for o in occurrences %}{{ o.label }} {{ o.2.event.title }} "
+            "{{ o.2.event.get_absolute_url }} {{ o.2|google_calendar_url }}{% endfor %}",
+            "mezzanine_events/includes/occurrence_heatmap.html": "{{ months }}",
+        }
+    )
+)
+class QueryBudgetTest(TestCase):
+    """
+    The views, the template tags and the import run the same queries with
+    10 and 1,000 events.
+    """
+
+    def seed(self, count):
+        """
+        Weekly events that started last year, each one in a category and
+        related to the first event, with their recommendations.
+        """
+        site = Site.objects.get()
+        base = now() - timedelta(days=365)
+        occurrences = create_events(site, count, repeat="RRULE:FREQ=WEEKLY", base=base)
+        event_ids = sorted(set(o.event_id for o in occurrences))
+        categories = list(EventCategory.objects.all())
+        Event.categories.through.objects.bulk_create(
+            Event.categories.through(event_id=pk, eventcategory_id=categories[i % 3].pk)
+            for i, pk in enumerate(event_ids)
+        )
+        Event.objects.filter(pk__in=event_ids[::7]).update(featured=True)
+        self.events += event_ids
+        first = self.events[0]
+        Related = Event.related_events.through
+        Related.objects.bulk_create(
+            Related(from_event_id=a, to_event_id=b)
+            for pk in event_ids
+            if pk != first
+            for a, b in ((first, pk), (pk, first))
+        )
+        # Enough upcoming events to fill the recommendations
+        for event in Event.objects.filter(pk__in=event_ids[:10]):
+            event.update_dates()
+        update_recommendations()
+
+    def capture(self):
+        """
+        Normalized queries of each code path.
+        """
+        event = Event.objects.get(pk=self.events[0])
+        month = today()
+        end_day = (month + timedelta(days=30)).strftime("%m/%d/%Y")
+        paths = [
+            ("grid", reverse("mezzanine_events:event_grid", args=[month.year, month.month]), {}),
+            ("list", reverse("mezzanine_events:event_list"), {"end_day": end_day}),
+            (
+                "list by category",
+                reverse("mezzanine_events:event_list"),
+                {"categories": event.categories.get().pk},
+            ),
+            ("detail", event.get_absolute_url(), {}),
+            ("json", reverse("mezzanine_events:event_json", args=[event.pk]), {}),
+        ]
+        counts = {}
+        for name, url, params in paths:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, name)
+            counts[name] = Counter(normalize_sql(q["sql"]) for q in context.captured_queries)
+
+        template = Template(
+            "{% load events_tags %}{% upcoming_occurrences %}{% upcoming_occurrences 'music' %}"
+            "{% occurrence_heatmap %}"
+        )
+        with CaptureQueriesContext(connection) as context:
+            with override_current_site_id(event.site_id):
+                template.render(Context())
+        counts["tags"] = Counter(normalize_sql(q["sql"]) for q in context.captured_queries)
+
+        data = json.loads(response.content.decode())
+        event_admin = admin.site._registry[Event]
+        with CaptureQueriesContext(connection) as context:
+            with override_current_site_id(event.site_id):
+                imported = event_admin.create_event(data, "http://example.com/", event.user)
+        counts["import"] = Counter(normalize_sql(q["sql"]) for q in context.captured_queries)
+        imported.delete()  # The next import gets the same slug
+        return counts
+
+    def test_query_counts(self):
+        for title in ("Music", "Theatre", "Dance"):
+            EventCategory.objects.create(title=title)
+        self.events = []
+        self.seed(10)
+        small = self.capture()
+        self.seed(990)
+        large = self.capture()
+
+        report = []
+        for name in sorted(small):
+            grown = large[name] - small[name]
+            if grown:
+                report.append("{} runs more queries with 1,000 events:".format(name))
+                report.extend("  +{} {}".format(n, sql) for sql, n in grown.most_common())
+        self.assertFalse(report, "\n".join(report))
+
+
+class WarmupTest(TestCase):
+    @override_settings(
+        TEMPLATES=locmem_templates(
+            {
+                "mezzanine_events/event_grid.html": "{{ calendar }}",
+                "mezzanine_events/event_list.html": "{{ occurrences }}",
+                "mezzanine_events/event_detail.html": "{{ event.title }}",
+                "mezzanine_events/includes/upcoming_occurrences.html": "{{ occurrences }}",
+            }
+        )
+    )
+    def test_site_tasks(self):
+        EventCategory.objects.create(title="Music")
+        create_event(slug="concert").occurrences.create(start=now() + timedelta(days=1))
+        tasks = site_tasks(Site.objects.get(), months=2, list_pages=2)
+        self.assertEqual(
+            [t.kind for t in tasks], ["grid", "grid", "list", "list", "upcoming"] * 2 + ["detail"]
+        )
+        self.assertIn("categories=", tasks[5].label)
+        self.assertIn("page=2", tasks[3].label)
+        for result in map(run, tasks):
+            self.assertEqual((result.task.label, result.status), (result.task.label, 200))
+
+
+@skipUnless(REPLICA in django_settings.DATABASES, "No database named 'replica' is configured")
+@override_settings(
+    DATABASE_ROUTERS=["mezzanine_events.routing.ReplicaRouter"],
+    EVENTS_READ_DATABASE=REPLICA,
+    TEMPLATES=locmem_templates(
+        {
+            "mezzanine_events/event_list.html": "{% for o in occurrences %}{{ o.2.event }}"
+            "{% endfor %}",
+            "mezzanine_events/event_detail.html": "{% load events_tags %}{{ event.title }} "
+            "{% upcoming_occurrences %}",
+            "mezzanine_events/includes/upcoming_occurrences.html": "{% for o in occurrences %}"
+            "{{ o.2.event }}{% endfor %}",
+        }
+    ),
+)
+class ReplicaTest(TestCase):
+    multi_db = True
+
+    def setUp(self):
+        # The replica hasn't received the event yet
+        self.event = create_event(title="Concert", slug="concert")
+        self.event.occurrences.create(start=now() + timedelta(days=1))
+        self.url = self.event.get_absolute_url()
+
+    def test_routing(self):
+        with CaptureQueriesContext(connection) as default_queries:
+            with CaptureQueriesContext(connections[REPLICA]) as replica_queries:
+                self.assertEqual(self.client.get(self.url).status_code, 404)
+                response = self.client.get(reverse("mezzanine_events:event_list"))
+        self.assertNotContains(response, "Concert")
+        self.assertFalse([q for q in default_queries if "mezzanine_events_" in q["sql"]])
+        self.assertTrue([q for q in replica_queries if "mezzanine_events_event" in q["sql"]])
+
+        with override_settings(EVENTS_READ_DATABASE=""):
+            self.assertContains(self.client.get(self.url), "Concert Concert")
+
+        # What's read from the replica is saved to the default database
+        self.event._state.db = REPLICA
+        self.assertEqual(router.db_for_write(Event, instance=self.event), "default")
+
+    def test_other_apps(self):
+        """
+        Sessions read in a view that uses the replica still come from the default database.
+        """
+        session = self.client.session
+        session["answer"] = 42
+        session.save()
+        request = RequestFactory().get(self.url)
+        request.session = type(session)(session.session_key)
+        view = routing.use_replica(lambda request: request.session["answer"])
+        with CaptureQueriesContext(connection) as default_queries:
+            with CaptureQueriesContext(connections[REPLICA]) as replica_queries:
+                self.assertEqual(view(request), 42)
+        self.assertEqual(len(replica_queries), 0)
+        self.assertTrue([q for q in default_queries if "django_session" in q["sql"]])
+
+    def test_stickiness(self):
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        changelist = reverse("admin:mezzanine_events_event_changelist")
+        data = {
+            "form-TOTAL_FORMS": 1,
+            "form-INITIAL_FORMS": 1,
+            "form-0-id": self.event.pk,
+            "form-0-featured": "on",
+            "_save": "Save",
+        }
+        self.assertEqual(self.client.post(changelist, data).status_code, 302)
+        self.assertContains(self.client.get(self.url), "Concert Concert")
+        # Only for the staff member that saved the event
+        self.assertEqual(Client().get(self.url).status_code, 404)
+
+        session = self.client.session
+        session[routing.SESSION_KEY] = time() - 1
+        session.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
@@ -12,6 +12,15 @@ urlpatterns = [
     url(r"^month/$", views.month_redirect, name="month"),
     url(r"^list/$", views.event_list, name="event_list"),
     url(r"^(?P<year>\d{4})/(?P<month>0?[1-9]|1[012])/$", views.event_grid, name="event_grid"),
+    url(r"^archive/(?P<year>\d{4})/$", views.event_archive_year, name="event_archive_year"),
+    url(
+        r"^archive/(?P<year>\d{4})/(?P<month>0?[1-9]|1[012])/$",
+        views.event_archive_month,
+        name="event_archive_month",
+    ),
+    url(r"^nearby/$", views.event_nearby, name="event_nearby"),
+    url(r"^conflicts/$", views.occurrence_conflicts, name="occurrence_conflicts"),
     url(r"^event/(?P<pk>\d+)/json/$", views.event_json, name="event_json"),
+    url(r"^event/(?P<slug>.*)/calendar\.ics$", views.event_ics, name="event_ics"),
     url(r"^event/(?P<slug>.*)/$", views.event_detail, name="event_detail"),
 ]
@@ -2,9 +2,10 @@ from __future__ import absolute_import, unicode_literals
 
 from datetime import datetime, date, time
 
-from django.template.defaultfilters import date as datefmt
 from django.utils.timezone import localtime, now, make_aware
 
+from .formatting import get_formatter
+
 EVENT_FIELDS = (
     "keywords_string",
     "site",
@@ -60,18 +61,7 @@ def duration_info(start, end=None):
     """
     Human readable representation of a time interval.
     """
-    if not isinstance(start, datetime):
-        return ""
-
-    local_start = localtime(start)
-    out = datefmt(local_start, "DATETIME_FORMAT")
-    if end not in (None, start):
-        local_end = localtime(end)
-        if local_end.date() == local_start.date():
-            out += " to {}".format(datefmt(local_end, "TIME_FORMAT"))
-        else:
-            out += " to {}".format(datefmt(local_end, "DATETIME_FORMAT"))
-    return out
+    return get_formatter().duration(start, end)
 
 
 def convert(obj):
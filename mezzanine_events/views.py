@@ -2,21 +2,31 @@ from __future__ import absolute_import, unicode_literals
 
 import json
 
-from calendar import Calendar
-from datetime import datetime, timedelta
+from calendar import Calendar, monthrange
+from datetime import date, datetime, timedelta
 from itertools import groupby
+from operator import attrgetter
 
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.serializers import serialize
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
+from django.db.models import Prefetch
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
 from django.utils.timezone import make_aware, localtime, now
 
 from mezzanine.conf import settings
 from mezzanine.utils.views import paginate
 
-from .forms import GridFilterForm, ListFilterForm
-from .models import Event, Occurrence
+from .archive import archive_months
+from .caching import cached
+from .calendar_links import for_request, ics_calendar
+from .concurrency import run_concurrently
+from .formatting import get_formatter
+from .forms import ConflictCheckForm, GridFilterForm, ListFilterForm, NearbyForm
+from .models import ArchivedOccurrence, Event, EventCategory, Occurrence
+from .partition import listing, published_occurrences
+from .routing import use_replica
 from .utils import today
 
 
@@ -25,6 +35,20 @@ def get_date(occurrence_tuple):
     return localtime(start).date()
 
 
+def is_current(occurrence_tuple, when):
+    start, end, original_occurrence = occurrence_tuple
+    return max(start, end or start) >= when
+
+
+def prepare(request, occurrence_tuples):
+    """
+    Attach the labels and calendar links shown with each occurrence. They
+    depend on the language, timezone and host, so this happens after the cache.
+    """
+    occurrence_tuples = get_formatter().label_all(occurrence_tuples)
+    return for_request(request).link_all(occurrence_tuples)
+
+
 def month_redirect(request):
     """
     Redirect to the grid for the current month.
@@ -32,6 +56,7 @@ def month_redirect(request):
     return redirect("mezzanine_events:event_grid", *today().strftime("%Y %m").split())
 
 
+@use_replica
 def event_grid(request, year, month):
     """
     Classic grid view of the occurrences for a given month.
@@ -46,10 +71,15 @@ def event_grid(request, year, month):
     last_day = make_aware(last_day)
 
     form = GridFilterForm(request.GET)
-    occurrences = Occurrence.objects.published().select_related("event")
+    occurrences = published_occurrences(first_day)
+    cache_parts = []
     if form.is_valid():
-        occurrences = form.filter(occurrences)
-    occurrence_tuples = occurrences.all_occurrences(first_day, last_day)
+        occurrences = [form.filter(qs) for qs in occurrences]
+        cache_parts = form.cache_parts()
+    occurrence_tuples = cached(
+        lambda: listing(occurrences, first_day, last_day), "grid", year, month, *cache_parts
+    )
+    occurrence_tuples = prepare(request, occurrence_tuples)
 
     by_day = dict((dt, list(occ)) for dt, occ in groupby(occurrence_tuples, get_date))
     context = {
@@ -64,6 +94,7 @@ def event_grid(request, year, month):
     return render(request, "mezzanine_events/event_grid.html", context)
 
 
+@use_replica
 def event_list(request):
     """
     List view of all events.
@@ -72,29 +103,51 @@ def event_list(request):
     start = None
     end = None
     form = ListFilterForm(request.GET)
-    occurrences = Occurrence.objects.published().select_related("event")
+    cache_parts = []
 
     if form.is_valid():
-        occurrences = form.filter(occurrences)
         start = form.cleaned_data["start_day"]
         end = form.cleaned_data["end_day"]
+        cache_parts = form.cache_parts()
+        occurrences = [form.filter(qs) for qs in published_occurrences(start)]
+    else:
+        occurrences = published_occurrences()
 
-    # Adjust to include the current time if start is set to today
-    if start == today():
-        start = now()
+    def get_occurrences(featured):
+        """
+        Expand from the start of the day so the result can be cached, then
+        discard what already ended if start is set to today.
+        """
+        querysets = [qs.filter(event__featured=featured) for qs in occurrences]
+        occurrence_tuples = cached(
+            lambda: listing(querysets, start, end), "list", featured, *cache_parts
+        )
+        if start == today():
+            current_time = now()
+            occurrence_tuples = [t for t in occurrence_tuples if is_current(t, current_time)]
+        return occurrence_tuples
 
+    featured_occurrences, regular_occurrences = run_concurrently(
+        lambda: get_occurrences(featured=True), lambda: get_occurrences(featured=False)
+    )
     featured_occurrences = paginate(
-        list(occurrences.filter(event__featured=True).all_occurrences(start, end)),
+        featured_occurrences,
         page_num=request.GET.get("featured-page", 1),
         per_page=settings.EVENTS_FEATURED_PER_PAGE,
         max_paging_links=settings.MAX_PAGING_LINKS,
     )
     regular_occurrences = paginate(
-        list(occurrences.filter(event__featured=False).all_occurrences(start, end)),
+        regular_occurrences,
         page_num=request.GET.get("page", 1),
         per_page=settings.EVENTS_PER_PAGE,
         max_paging_links=settings.MAX_PAGING_LINKS,
     )
+    for page in (featured_occurrences, regular_occurrences):
+        page.object_list = prepare(request, page.object_list)
+
+    # Adjust to include the current time if start is set to today
+    if start == today():
+        start = now()
 
     context = {
         "today": today(),
@@ -108,6 +161,69 @@ def event_list(request):
     return render(request, "mezzanine_events/event_list.html", context)
 
 
+def archive_context(request, year):
+    """
+    Navigation shared by the archive views, built from the month counts.
+    """
+    category = None
+    if request.GET.get("category"):
+        category = get_object_or_404(EventCategory, slug=request.GET["category"])
+    months = archive_months(category and category.slug)
+    counts = dict(((y, m), count) for y, m, count in months)
+    # Repetitions without an end are counted years ahead, the archive stops at this year
+    current_year = today().year
+    return {
+        "category": category,
+        "year": year,
+        "years": sorted(set(y for y, m, count in months if y <= current_year)),
+        "months": [(date(year, m, 1), counts.get((year, m), 0)) for m in range(1, 13)],
+    }
+
+
+@use_replica
+def event_archive_year(request, year):
+    """
+    Months of a year with the number of occurrences in each of them.
+    """
+    context = archive_context(request, int(year))
+    return render(request, "mezzanine_events/event_archive_year.html", context)
+
+
+@use_replica
+def event_archive_month(request, year, month):
+    """
+    All the occurrences of a month, with links to the other months.
+    """
+    year, month = int(year), int(month)
+    context = archive_context(request, year)
+    current_month = context["months"][month - 1][0]
+    last_date = date(year, month, monthrange(year, month)[1])
+    first_day = make_aware(datetime.combine(current_month, datetime.min.time()))
+    last_day = make_aware(datetime.combine(last_date, datetime.max.time()))
+
+    occurrences = published_occurrences(first_day)
+    category = context["category"]
+    if category is not None:
+        occurrences = [qs.filter(event__categories=category) for qs in occurrences]
+    occurrence_tuples = cached(
+        lambda: listing(occurrences, first_day, last_day),
+        "archive",
+        year,
+        month,
+        category and category.pk,
+    )
+    context["current_month"] = current_month
+    context["occurrences"] = paginate(
+        occurrence_tuples,
+        page_num=request.GET.get("page", 1),
+        per_page=settings.EVENTS_PER_PAGE,
+        max_paging_links=settings.MAX_PAGING_LINKS,
+    )
+    context["occurrences"].object_list = prepare(request, context["occurrences"].object_list)
+    return render(request, "mezzanine_events/event_archive_month.html", context)
+
+
+@use_replica
 def event_detail(request, slug):
     """
     Detail page for an event.
@@ -119,11 +235,31 @@ def event_detail(request, slug):
     if request.is_ajax():
         templates.insert(0, "mezzanine_events/event_detail_ajax.html")
 
-    events = Event.objects.published(for_user=request.user).select_related()
+    # With an explicit queryset the site-scoped manager isn't consulted once per event
+    categories = Prefetch("categories", queryset=EventCategory.objects.all())
+    related_events = Event.objects.published(for_user=request.user).prefetch_related(categories)
+    events = (
+        Event.objects.published(for_user=request.user)
+        .select_related()
+        .prefetch_related(
+            "categories",
+            "occurrences",
+            "archived_occurrences",
+            Prefetch("related_events", queryset=related_events),
+        )
+    )
     event = get_object_or_404(events, slug=slug)
+    # Precomputed by update_event_recommendations, read in one query
+    recommended_events = (
+        Event.objects.published(for_user=request.user)
+        .filter(recommended_for__event=event)
+        .order_by("recommended_for__rank")
+    )
 
     context = {
         "event": event,
+        "occurrences": event.stored_occurrences(),
+        "recommended_events": recommended_events,
         "editable_obj": event,
         "filter_form": ListFilterForm(),
         "filter_form_url": reverse("mezzanine_events:event_list"),
@@ -131,12 +267,86 @@ def event_detail(request, slug):
     return render(request, templates, context)
 
 
+@use_replica
+def event_ics(request, slug):
+    """
+    iCalendar file with the occurrences of an event.
+    """
+    event = get_object_or_404(Event.objects.published(for_user=request.user), slug=slug)
+    response = HttpResponse(
+        ics_calendar(event, event.stored_occurrences(), request), content_type="text/calendar"
+    )
+    response["Content-Disposition"] = 'attachment; filename="{}.ics"'.format(event.slug)
+    return response
+
+
+@use_replica
 def event_json(request, pk):
     """
     Returns a JSON representation of an Event.
     Other sites can use this endpoint to import events.
     """
-    event = get_object_or_404(Event.objects.published(), pk=pk)
+    event, live, archived = run_concurrently(
+        lambda: get_object_or_404(Event.objects.published(), pk=pk),
+        lambda: list(Occurrence.objects.filter(event_id=pk)),
+        lambda: list(ArchivedOccurrence.objects.filter(event_id=pk)),
+    )
+    # Archived occurrences are exported like the live ones they were
+    occurrences = live + [o.as_occurrence() for o in archived]
+    occurrences.sort(key=attrgetter("start"))
     event_dict = json.loads(serialize("json", [event]))[0]
-    event_dict["occurrences"] = json.loads(serialize("json", event.occurrences.all()))
+    event_dict["occurrences"] = json.loads(serialize("json", occurrences))
     return HttpResponse(json.dumps(event_dict), content_type="application/json")
+
+
+@use_replica
+def event_nearby(request):
+    """
+    Returns a JSON list of the upcoming occurrences within a radius of a point.
+    """
+    form = NearbyForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+
+    occurrences = []
+    for occurrence_tuple in form.occurrences():
+        start, end, occurrence = occurrence_tuple
+        event = occurrence.event
+        occurrences.append(
+            {
+                "event": event.pk,
+                "title": event.title,
+                "url": event.get_absolute_url(),
+                "start": start.isoformat(),
+                "end": end and end.isoformat(),
+                "latitude": event.latitude,
+                "longitude": event.longitude,
+                "distance": round(occurrence_tuple.distance, 3),
+            }
+        )
+    return JsonResponse({"occurrences": occurrences})
+
+
+@staff_member_required
+def occurrence_conflicts(request):
+    """
+    Returns a JSON list of the occurrences at a location that overlap
+    the occurrence described in the query string.
+    """
+    form = ConflictCheckForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+
+    conflicts = [
+        {
+            "event": c.occurrence.event_id,
+            "title": c.occurrence.event.title,
+            "url": c.occurrence.event.get_absolute_url(),
+            "start": c.start.isoformat(),
+            "end": c.end.isoformat(),
+            "proposed_start": c.proposed_start.isoformat(),
+            "proposed_end": c.proposed_end.isoformat(),
+        }
+        for c in form.conflicts()
+    ]
+    return JsonResponse({"conflicts": conflicts})
@@ -0,0 +1,171 @@
+"""
+Pre-rendering of calendar pages, so the first visitors after a deploy, an
+import or a change don't pay for the expansion of occurrences. Requests
+for the domain of their site go through the middleware and the views,
+filling both the page cache and the calendar data cache.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import threading
+
+from collections import namedtuple
+from timeit import default_timer
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.base import BaseHandler
+from django.core.urlresolvers import reverse
+from django.db import close_old_connections, transaction
+from django.template import Context
+from django.test import RequestFactory
+from django.utils.http import urlencode
+from django.utils.timezone import localtime
+
+from mezzanine.utils.sites import override_current_site_id
+
+from .expansion import month_index, month_start
+from .models import Event, EventCategory
+from .templatetags.events_tags import upcoming_occurrences
+from .utils import today
+
+# A page or fragment to render, ``render()`` returns a status code
+Task = namedtuple("Task", "kind site label render")
+Result = namedtuple("Result", "task status seconds error")
+
+_local = threading.local()
+
+# Background warming after saves, one event at a time
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def get_response(request):
+    """
+    Handle a request with the middleware loaded once per thread. Unlike the
+    test client, errors become responses and can be handled from many threads.
+    """
+    if not hasattr(_local, "handler"):
+        _local.handler = BaseHandler()
+        _local.handler.load_middleware()
+    response = _local.handler.get_response(request)
+    response.close()
+    return response
+
+
+def page(kind, site, path, **params):
+    if params:
+        path += "?" + urlencode(sorted(params.items()))
+
+    def render():
+        return get_response(RequestFactory().get(path, HTTP_HOST=site.domain)).status_code
+
+    return Task(kind, site, path, render)
+
+
+def fragment(site, category_slug):
+    def render():
+        with override_current_site_id(site.pk):
+            upcoming_occurrences(Context(), category_slug)
+        return 200
+
+    return Task("upcoming", site, "upcoming_occurrences %s" % (category_slug or ""), render)
+
+
+def site_tasks(site, months=3, list_pages=1, events=50):
+    """
+    Month grids, list pages and upcoming fragments of a site for all events
+    and for each category, and the detail pages of its upcoming events.
+    """
+    with override_current_site_id(site.pk):
+        categories = [(None, None)] + list(EventCategory.objects.values_list("pk", "slug"))
+        slugs = list(Event.objects.upcoming().values_list("slug", flat=True)[:events])
+
+    tasks = []
+    first = month_index(today())
+    for pk, slug in categories:
+        params = {"categories": pk} if pk else {}
+        for i in range(first, first + months):
+            month = month_start(i)
+            path = reverse("mezzanine_events:event_grid", args=[month.year, month.month])
+            tasks.append(page("grid", site, path, **params))
+        path = reverse("mezzanine_events:event_list")
+        tasks.append(page("list", site, path, **params))
+        for number in range(2, list_pages + 1):
+            tasks.append(page("list", site, path, page=number, **params))
+        tasks.append(fragment(site, slug))
+    for slug in slugs:
+        tasks.append(page("detail", site, reverse("mezzanine_events:event_detail", args=[slug])))
+    return tasks
+
+
+def event_tasks(event):
+    """
+    The pages that show an event: its detail page, the month grids of
+    today and of its next start, the first list page and the upcoming fragments.
+    """
+    site = event.site
+    days = [today()]
+    if event.next_start:
+        days.append(localtime(event.next_start).date())
+    tasks = [page("detail", site, event.get_absolute_url())]
+    for year, month in sorted(set((day.year, day.month) for day in days)):
+        tasks.append(
+            page("grid", site, reverse("mezzanine_events:event_grid", args=[year, month]))
+        )
+    tasks.append(page("list", site, reverse("mezzanine_events:event_list")))
+    tasks.append(fragment(site, None))
+    tasks.extend(fragment(site, category.slug) for category in event.categories.all())
+    return tasks
+
+
+def run(task):
+    """
+    Render a task, errors are reported in the result.
+    """
+    close_old_connections()
+    start = default_timer()
+    try:
+        return Result(task, task.render(), default_timer() - start, None)
+    except Exception as e:
+        return Result(task, None, default_timer() - start, e)
+    finally:
+        close_old_connections()
+
+
+def warm(tasks, workers=4):
+    """
+    Render the tasks with a pool of ``workers`` threads, return their results.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, tasks))
+
+
+def warm_event(event):
+    """
+    Warm the pages of an event once the current transaction is committed,
+    in a single background thread. Saves of an event that is still waiting
+    to be warmed add nothing. Enabled after saves with ``EVENTS_WARM_CACHE_ON_SAVE``.
+    """
+
+    def warm_pending():
+        with _lock:
+            _pending.discard(event.pk)
+        try:
+            tasks = event_tasks(event)
+        finally:
+            close_old_connections()
+        for task in tasks:
+            run(task)
+
+    def submit():
+        global _executor
+        with _lock:
+            if event.pk in _pending:
+                return
+            _pending.add(event.pk)
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1)
+        _executor.submit(warm_pending)
+
+    transaction.on_commit(submit)
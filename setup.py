@@ -61,6 +61,11 @@ setup(
     ],
     keywords="django mezzanine",
     packages=find_packages(),
-    install_requires=["django>=1.7", "django-eventtools>=0.9,<1.0"],
+    install_requires=[
+        "django>=1.11",
+        "django-eventtools>=0.9,<1.0",
+        'futures; python_version < "3"',
+    ],
+    extras_require={"numpy": ["numpy"]},
     include_package_data=True,
 )